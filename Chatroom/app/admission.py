@@ -0,0 +1,120 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+from sqlalchemy.engine import Engine
+
+# Admission control in front of the DB pool. Every unit of DB work (an HTTP
+# request or a socket event) is admitted with a priority; when the pool is
+# close to exhausted or checkouts are waiting too long, low-value work is
+# rejected first so that messages keep flowing and nothing sits blocked for
+# the full pool timeout.
+
+PRIORITY_LOW = 0     # typing indicators, presence fan-out
+PRIORITY_NORMAL = 1  # HTTP reads
+PRIORITY_HIGH = 2    # sending messages
+
+PRESSURE_OK = "ok"
+PRESSURE_ELEVATED = "elevated"  # shed low priority work
+PRESSURE_CRITICAL = "critical"  # shed everything except high priority work
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: float, pressure: str):
+        super().__init__(f"Server overloaded ({pressure}), retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+        self.pressure = pressure
+
+class AdmissionController:
+    def __init__(self, capacity_fn: Callable[[], int], checked_out_fn: Callable[[], int],
+                 elevated_utilization: float = 0.7, critical_utilization: float = 0.9,
+                 elevated_wait: float = 0.1, critical_wait: float = 0.5,
+                 max_in_flight: int = 0, retry_after: float = 1.0):
+        self.capacity_fn = capacity_fn
+        self.checked_out_fn = checked_out_fn
+        self.elevated_utilization = elevated_utilization
+        self.critical_utilization = critical_utilization
+        self.elevated_wait = elevated_wait
+        self.critical_wait = critical_wait
+        self.max_in_flight = max_in_flight  # 0 = 4x pool capacity
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.wait_ewma = 0.0  # seconds, smoothed pool checkout wait
+        self._lock = threading.Lock()
+        self.stats = {"admitted": 0, "shed_low": 0, "shed_normal": 0, "shed_high": 0}
+
+    def watch_engine(self, engine: Engine):
+        """Measure pool wait: time spent inside pool.connect(), i.e. queued for a connection."""
+        pool = engine.pool
+        connect = pool.connect
+
+        def timed_connect():
+            started = time.monotonic()
+            try:
+                return connect()
+            finally:
+                self.record_wait(time.monotonic() - started)
+
+        pool.connect = timed_connect
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.wait_ewma = 0.8 * self.wait_ewma + 0.2 * seconds
+
+    def pressure(self) -> str:
+        capacity = max(1, self.capacity_fn())
+        utilization = self.checked_out_fn() / capacity
+        if utilization >= self.critical_utilization or self.wait_ewma >= self.critical_wait:
+            return PRESSURE_CRITICAL
+        if utilization >= self.elevated_utilization or self.wait_ewma >= self.elevated_wait:
+            return PRESSURE_ELEVATED
+        return PRESSURE_OK
+
+    def should_shed(self, priority: int) -> bool:
+        pressure = self.pressure()
+        if priority == PRIORITY_LOW:
+            return pressure != PRESSURE_OK
+        if priority == PRIORITY_NORMAL:
+            return pressure == PRESSURE_CRITICAL
+        max_in_flight = self.max_in_flight or 4 * max(1, self.capacity_fn())
+        return self.in_flight >= max_in_flight
+
+    def enter(self, priority: int = PRIORITY_NORMAL):
+        """Admit one unit of work or raise Overloaded. Pair with leave()."""
+        if self.should_shed(priority):
+            key = {PRIORITY_LOW: "shed_low", PRIORITY_NORMAL: "shed_normal"}.get(priority, "shed_high")
+            with self._lock:
+                self.stats[key] += 1
+            raise Overloaded(self.retry_after, self.pressure())
+        with self._lock:
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+        # Decay the wait estimate while the pool is idle so pressure can clear
+        if self.checked_out_fn() == 0:
+            self.record_wait(0.0)
+
+    @contextmanager
+    def admit(self, priority: int = PRIORITY_NORMAL):
+        self.enter(priority)
+        try:
+            yield
+        finally:
+            self.leave()
+
+    def get_status(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            in_flight = self.in_flight
+            wait_ms = round(self.wait_ewma * 1000, 3)
+        return {
+            "pressure": self.pressure(),
+            "in_flight": in_flight,
+            "pool_capacity": self.capacity_fn(),
+            "pool_checked_out": self.checked_out_fn(),
+            "pool_wait_ms": wait_ms,
+            "totals": stats,
+        }
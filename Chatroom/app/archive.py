@@ -0,0 +1,196 @@
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import Table, Column, Integer, String, DateTime, LargeBinary, Index, MetaData, select, insert, delete, func
+from sqlalchemy.orm import Session, joinedload
+
+from .models import User, Attachment, AttachmentConversation, Message, MessageRead, MessageArchiveSegment, ContentType
+
+# Messages older than the retention window are moved out of the hot `messages`
+# table into one compact table per month. Content is zlib-compressed and each
+# archive table only carries a (conversation_id, id) index. The
+# message_archive_segments table records the id range of every segment so
+# readers can skip segments that cannot contain the requested page.
+
+ARCHIVE_TABLE_PREFIX = "messages_archive_"
+DEFAULT_RETENTION_DAYS = 180
+
+# Kept out of Base.metadata so create_all() never touches archive tables
+archive_metadata = MetaData()
+
+def archive_table_name(created_at: datetime) -> str:
+    return f"{ARCHIVE_TABLE_PREFIX}{created_at:%Y%m}"
+
+def get_archive_table(name: str) -> Table:
+    if name in archive_metadata.tables:
+        return archive_metadata.tables[name]
+    return Table(
+        name, archive_metadata,
+        Column("id", Integer, primary_key=True),
+        Column("conversation_id", Integer, nullable=False),
+        Column("sender_id", Integer, nullable=False),
+        Column("created_at", DateTime(timezone=True)),
+        Column("content_z", LargeBinary, nullable=False),
+        Column("content_type", String, nullable=False, server_default=ContentType.text.name),
+        Column("attachment_id", Integer),
+        Index(f"ix_{name}_conversation_id_id", "conversation_id", "id"),
+    )
+
+def archive_table_names(db: Session) -> List[str]:
+    return [name for (name,) in db.query(MessageArchiveSegment.table_name).distinct()]
+
+def archived_high_water_mark(db: Session) -> int:
+    """Highest message id ever archived; new messages must be numbered above it."""
+    return db.query(func.max(MessageArchiveSegment.max_message_id)).scalar() or 0
+
+def backfill_attachment_links(db: Session) -> int:
+    """Fill attachment_conversations from messages sent before it existed, archived ones included."""
+    linked = 0
+    sources = [Message.__table__] + [get_archive_table(name) for name in archive_table_names(db)]
+    for table in sources:
+        linked += db.execute(
+            insert(AttachmentConversation).prefix_with("OR IGNORE", dialect="sqlite").from_select(
+                ["attachment_id", "conversation_id"],
+                select(table.c.attachment_id, table.c.conversation_id)
+                .where(table.c.attachment_id.is_not(None))
+                .distinct()
+            )
+        ).rowcount
+    db.commit()
+    return linked
+
+def archive_messages(db: Session, older_than: datetime, batch_size: int = 1000, dry_run: bool = False) -> dict:
+    """Move messages created before `older_than` into monthly archive tables."""
+    stats = {"archived": 0, "reads_deleted": 0, "segments": defaultdict(int), "batches": 0}
+
+    if dry_run:
+        stats["archived"] = db.query(func.count(Message.id)).filter(Message.created_at < older_than).scalar()
+        return stats
+
+    while True:
+        rows = db.execute(
+            select(Message.id, Message.conversation_id, Message.sender_id, Message.created_at, Message.content,
+                   Message.content_type, Message.attachment_id)
+            .where(Message.created_at < older_than)
+            .order_by(Message.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        by_table = defaultdict(list)
+        for row in rows:
+            by_table[archive_table_name(row.created_at)].append({
+                "id": row.id,
+                "conversation_id": row.conversation_id,
+                "sender_id": row.sender_id,
+                "created_at": row.created_at,
+                "content_z": zlib.compress(row.content.encode("utf-8")),
+                "content_type": row.content_type.name,
+                "attachment_id": row.attachment_id,
+            })
+
+        for name, values in by_table.items():
+            table = get_archive_table(name)
+            table.create(bind=db.connection(), checkfirst=True)
+            db.execute(insert(table), values)
+            _update_segment(db, name, values)
+            stats["segments"][name] += len(values)
+
+        ids = [row.id for row in rows]
+        stats["reads_deleted"] += db.execute(delete(MessageRead).where(MessageRead.message_id.in_(ids))).rowcount
+        db.execute(delete(Message).where(Message.id.in_(ids)))
+        db.commit()
+
+        stats["archived"] += len(rows)
+        stats["batches"] += 1
+
+    stats["segments"] = dict(stats["segments"])
+    return stats
+
+def _update_segment(db: Session, name: str, values: List[dict]):
+    ids = [v["id"] for v in values]
+    segment = db.query(MessageArchiveSegment).filter(MessageArchiveSegment.table_name == name).first()
+    if not segment:
+        segment = MessageArchiveSegment(table_name=name, min_message_id=min(ids), max_message_id=max(ids), message_count=0)
+        db.add(segment)
+    segment.min_message_id = min(segment.min_message_id, min(ids))
+    segment.max_message_id = max(segment.max_message_id, max(ids))
+    segment.message_count += len(ids)
+
+def list_archived_messages(db: Session, conversation_id: int, limit: int = 50, offset: int = 0,
+                           before_id: Optional[int] = None) -> List[Message]:
+    """Newest-first page of archived messages, as detached Message objects with sender loaded."""
+    segments = db.query(MessageArchiveSegment).order_by(MessageArchiveSegment.max_message_id.desc()).all()
+
+    rows = []
+    for segment in segments:
+        if len(rows) >= limit:
+            break
+        if before_id is not None and segment.min_message_id >= before_id:
+            continue
+
+        table = get_archive_table(segment.table_name)
+        condition = table.c.conversation_id == conversation_id
+        if before_id is not None:
+            condition = condition & (table.c.id < before_id)
+
+        if offset:
+            # Skip whole segments using the (conversation_id, id) index
+            count = db.execute(select(func.count()).select_from(table).where(condition)).scalar()
+            if count <= offset:
+                offset -= count
+                continue
+
+        rows.extend(db.execute(
+            select(table).where(condition).order_by(table.c.id.desc()).offset(offset).limit(limit - len(rows))
+        ).all())
+        offset = 0
+
+    senders = {}
+    sender_ids = {row.sender_id for row in rows}
+    if sender_ids:
+        senders = {u.id: u for u in db.query(User).filter(User.id.in_(sender_ids)).all()}
+    attachments = {}
+    attachment_ids = {row.attachment_id for row in rows if row.attachment_id}
+    if attachment_ids:
+        attachments = {a.id: a for a in db.query(Attachment).options(joinedload(Attachment.blob))
+                       .filter(Attachment.id.in_(attachment_ids)).all()}
+
+    messages = []
+    for row in rows:
+        message = Message(
+            id=row.id,
+            conversation_id=row.conversation_id,
+            sender_id=row.sender_id,
+            content=zlib.decompress(row.content_z).decode("utf-8"),
+            content_type=ContentType[row.content_type],
+            attachment_id=row.attachment_id,
+            created_at=row.created_at,
+        )
+        message.sender = senders.get(row.sender_id)
+        message.attachment = attachments.get(row.attachment_id)
+        messages.append(message)
+    return messages
+
+def retention_cutoff(days: int = DEFAULT_RETENTION_DAYS) -> datetime:
+    # SQLite stores naive UTC timestamps via func.now()
+    return datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
+
+def iter_archived_rows(db: Session, conversation_id: int, chunk_size: int = 1000):
+    """Oldest-first stream of (row, content) pairs with sender data joined in, for exports."""
+    segments = db.query(MessageArchiveSegment).order_by(MessageArchiveSegment.min_message_id).all()
+    for segment in segments:
+        table = get_archive_table(segment.table_name)
+        result = db.execute(
+            select(table.c.id, table.c.conversation_id, table.c.sender_id, table.c.created_at, table.c.content_z,
+                   table.c.content_type, table.c.attachment_id, User.display_name, User.avatar_url)
+            .join(User, User.id == table.c.sender_id)
+            .where(table.c.conversation_id == conversation_id)
+            .order_by(table.c.id)
+            .execution_options(yield_per=chunk_size)
+        )
+        for row in result:
+            yield row, zlib.decompress(row.content_z).decode("utf-8")
@@ -0,0 +1,233 @@
+import hashlib
+import logging
+import os
+import secrets
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import BinaryIO, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .models import Attachment, AttachmentBlob, Upload
+
+try:
+    from PIL import Image
+except ImportError:  # thumbnails are skipped without Pillow
+    Image = None
+
+# File attachments. Uploads are resumable: the client creates an upload, then
+# sends the bytes in any number of PATCH requests, each starting at the offset
+# the server has confirmed. Request bodies are copied to a partial file in
+# fixed-size pieces, so an upload never sits in memory. On completion the
+# file is hashed from disk and stored once under its SHA-256
+# (<root>/blobs/<aa>/<sha256>); an identical file uploaded again reuses the
+# stored blob, while its filename and declared type stay with the new
+# attachment. Only PNG, JPEG, GIF and WebP files whose bytes match the
+# declared type are treated as images (shown inline, thumbnailed); everything
+# else is served as a download. Image thumbnails are generated on a worker pool.
+# Uploads that stay incomplete are removed by expire_uploads(), run by the
+# expire_uploads maintenance job.
+
+logger = logging.getLogger('chatroom.attachments')
+
+COPY_BUFFER = 64 * 1024
+
+# Raster formats safe to render inline, identified by their leading bytes
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+def is_inline_image(attachment: Attachment) -> bool:
+    """Declared as a raster image and the stored bytes really are one of that type."""
+    return attachment.blob.image_type is not None and attachment.mime_type == attachment.blob.image_type
+
+class UploadError(Exception):
+    pass
+
+def attachment_root() -> str:
+    return os.getenv('ATTACHMENT_DIR') or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'attachments')
+
+def partial_path(root: str, upload_id: str) -> str:
+    return os.path.join(root, 'partial', upload_id)
+
+def expire_uploads(db: Session, root: str, older_than: datetime) -> dict:
+    """Delete incomplete uploads not touched since `older_than`, with their partial files."""
+    stale = db.query(Upload).filter(
+        Upload.attachment_id.is_(None),
+        Upload.updated_at < older_than
+    ).all()
+    files_removed = 0
+    for upload in stale:
+        try:
+            os.remove(partial_path(root, upload.id))
+            files_removed += 1
+        except FileNotFoundError:
+            pass
+        db.delete(upload)
+    db.commit()
+    return {'uploads_expired': len(stale), 'partial_files_removed': files_removed}
+
+class AttachmentStore:
+    def __init__(self, root: str, session_factory, max_size: int = 100 * 1024 * 1024,
+                 thumbnail_size: int = 320, workers: int = 2):
+        self.root = root
+        self.session_factory = session_factory
+        self.max_size = max_size
+        self.thumbnail_size = thumbnail_size
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnail')
+        self._locks = {}  # upload id -> [lock, number of requests using it]
+        self._locks_guard = threading.Lock()
+        for sub in ('partial', 'blobs', 'thumbs'):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    def _partial_path(self, upload_id: str) -> str:
+        return partial_path(self.root, upload_id)
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, 'blobs', digest[:2], digest)
+
+    @contextmanager
+    def _upload_lock(self, upload_id: str):
+        """Serialize requests for one upload; the entry is dropped when the last one finishes."""
+        with self._locks_guard:
+            entry = self._locks.setdefault(upload_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._locks.pop(upload_id, None)
+
+    def create_upload(self, db: Session, user_id: int, filename: str, mime_type: str, size: int) -> Upload:
+        if size <= 0 or size > self.max_size:
+            raise UploadError(f'File size must be between 1 and {self.max_size} bytes')
+        upload = Upload(
+            id=secrets.token_hex(16),
+            user_id=user_id,
+            filename=os.path.basename(filename)[:255] or 'file',
+            mime_type=mime_type or 'application/octet-stream',
+            total_size=size,
+            received=0
+        )
+        db.add(upload)
+        db.commit()
+        open(self._partial_path(upload.id), 'wb').close()
+        return upload
+
+    def write_chunk(self, db: Session, upload: Upload, offset: int, stream: BinaryIO,
+                    length: Optional[int]) -> Upload:
+        """Append request body bytes at `offset`, which must equal the confirmed size so far."""
+        with self._upload_lock(upload.id):
+            db.refresh(upload)
+            if upload.attachment_id is not None:
+                raise UploadError('Upload already complete')
+            if offset != upload.received:
+                raise UploadError(f'Offset mismatch, expected {upload.received}')
+
+            remaining = upload.total_size - offset
+            if length is not None:
+                remaining = min(remaining, length)
+
+            path = self._partial_path(upload.id)
+            with open(path, 'r+b') as f:
+                # Drop bytes from an earlier chunk that was cut off before it was confirmed
+                f.seek(offset)
+                f.truncate()
+                while remaining > 0:
+                    piece = stream.read(min(COPY_BUFFER, remaining))
+                    if not piece:
+                        break
+                    f.write(piece)
+                    remaining -= len(piece)
+                received = f.tell()
+
+            upload.received = received
+            db.commit()
+
+            if upload.received == upload.total_size:
+                self._complete(db, upload)
+            return upload
+
+    def _complete(self, db: Session, upload: Upload):
+        path = self._partial_path(upload.id)
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            head = f.read(16)
+            sha.update(head)
+            for piece in iter(lambda: f.read(COPY_BUFFER), b''):
+                sha.update(piece)
+        digest = sha.hexdigest()
+
+        # Resolve the blob row first; the partial file is only moved once that succeeded
+        blob = db.query(AttachmentBlob).filter(AttachmentBlob.sha256 == digest).first()
+        created = False
+        if blob is None:
+            blob = AttachmentBlob(
+                sha256=digest,
+                size=upload.total_size,
+                image_type=sniff_image_type(head),
+                storage_path=self._blob_path(digest)
+            )
+            db.add(blob)
+            try:
+                db.flush()
+                created = True
+            except IntegrityError:
+                # An identical upload finished at the same time
+                db.rollback()
+                blob = db.query(AttachmentBlob).filter(AttachmentBlob.sha256 == digest).one()
+
+        if created:
+            os.makedirs(os.path.dirname(blob.storage_path), exist_ok=True)
+            shutil.move(path, blob.storage_path)
+        else:
+            os.remove(path)
+
+        attachment = Attachment(
+            blob_id=blob.id,
+            filename=upload.filename,
+            mime_type=upload.mime_type,
+            uploader_id=upload.user_id
+        )
+        db.add(attachment)
+        db.flush()
+        upload.attachment_id = attachment.id
+        db.commit()
+        if created and Image is not None and blob.image_type:
+            self._pool.submit(self._make_thumbnail, blob.id, blob.storage_path, digest)
+
+    def _make_thumbnail(self, blob_id: int, blob: str, digest: str):
+        thumb = os.path.join(self.root, 'thumbs', f'{digest}.png')
+        try:
+            with Image.open(blob) as image:
+                image.thumbnail((self.thumbnail_size, self.thumbnail_size))
+                image.save(thumb, format='PNG')
+        except Exception:
+            logger.exception('Thumbnail failed', extra={'blob_id': blob_id})
+            return
+
+        db = self.session_factory()
+        try:
+            db.query(AttachmentBlob).filter(AttachmentBlob.id == blob_id).update({'thumbnail_path': thumb})
+            db.commit()
+        finally:
+            db.close()
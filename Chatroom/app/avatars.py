@@ -0,0 +1,183 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # thumbnails are skipped without Pillow
+    Image = None
+
+# Avatars are fetched once per source URL, resized to a thumbnail and stored
+# under their content hash: <cache_dir>/<hash[:2]>/<hash>.png. A small
+# url-hash -> content-hash index lives next to them so a restart does not
+# refetch anything. Total size is capped with LRU eviction (file mtime is
+# bumped on every hit). A failed fetch is remembered for failure_ttl seconds
+# so a broken source URL does not tie up a worker on every request.
+
+MAX_SOURCE_BYTES = 5 * 1024 * 1024
+
+Fetcher = Callable[[str], bytes]
+
+def http_fetch(url: str) -> bytes:
+    import requests
+    response = requests.get(url, timeout=5, stream=True)
+    response.raise_for_status()
+    data = response.raw.read(MAX_SOURCE_BYTES + 1, decode_content=True)
+    if len(data) > MAX_SOURCE_BYTES:
+        raise ValueError("Avatar too large")
+    return data
+
+def url_key(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+def make_thumbnail(data: bytes, size: int) -> Tuple[bytes, str]:
+    """Returns (bytes, mimetype). Falls back to the original image without Pillow."""
+    if Image is None:
+        return data, "application/octet-stream"
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert("RGBA")
+        image.thumbnail((size, size))
+        out = io.BytesIO()
+        image.save(out, format="PNG", optimize=True)
+    return out.getvalue(), "image/png"
+
+class AvatarCache:
+    def __init__(self, cache_dir: str, fetcher: Fetcher = http_fetch, size: int = 128,
+                 max_bytes: int = 64 * 1024 * 1024, failure_ttl: float = 300.0):
+        self.cache_dir = cache_dir
+        self.fetcher = fetcher
+        self.size = size
+        self.max_bytes = max_bytes
+        self._lru: "OrderedDict[str, int]" = OrderedDict()  # content hash -> bytes
+        self._total = 0
+        self._lock = threading.Lock()
+        self._fetch_locks = {}
+        self.failure_ttl = failure_ttl
+        self._failures: Dict[str, float] = {}  # source URL -> monotonic time the failure expires
+        self.stats = {"hits": 0, "misses": 0, "errors": 0, "negative_hits": 0, "evictions": 0}
+        os.makedirs(os.path.join(cache_dir, "urls"), exist_ok=True)
+        self._load()
+
+    def _load(self):
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith(".png") or name.endswith(".bin"):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    files.append((stat.st_mtime, name.rsplit(".", 1)[0], stat.st_size))
+        for _, digest, size in sorted(files):
+            self._lru[digest] = size
+            self._total += size
+
+    def _blob_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.{ext}")
+
+    def _index_path(self, source_url: str) -> str:
+        return os.path.join(self.cache_dir, "urls", url_key(source_url))
+
+    def _lookup(self, source_url: str) -> Optional[Tuple[str, str]]:
+        try:
+            with open(self._index_path(source_url)) as f:
+                digest, mimetype = f.read().split()
+        except (OSError, ValueError):
+            return None
+        path = self._blob_path(digest, "png" if mimetype == "image/png" else "bin")
+        if digest not in self._lru or not os.path.exists(path):
+            return None
+        with self._lock:
+            self._lru.move_to_end(digest)
+        os.utime(path)
+        return path, mimetype
+
+    def _failed_recently(self, source_url: str) -> bool:
+        with self._lock:
+            expires = self._failures.get(source_url)
+            if expires is None:
+                return False
+            if expires > time.monotonic():
+                self.stats["negative_hits"] += 1
+                return True
+            del self._failures[source_url]
+            return False
+
+    def _record_failure(self, source_url: str):
+        now = time.monotonic()
+        with self._lock:
+            self.stats["errors"] += 1
+            for url in [u for u, expires in self._failures.items() if expires <= now]:
+                del self._failures[url]
+            self._failures[source_url] = now + self.failure_ttl
+
+    def get(self, source_url: str) -> Optional[Tuple[str, str]]:
+        """Returns (path, mimetype) of the cached thumbnail, fetching it on first use."""
+        cached = self._lookup(source_url)
+        if cached:
+            self.stats["hits"] += 1
+            return cached
+        if self._failed_recently(source_url):
+            return None
+
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(source_url, threading.Lock())
+        with fetch_lock:
+            # Another thread may have fetched it while we waited
+            cached = self._lookup(source_url)
+            if cached:
+                self.stats["hits"] += 1
+                return cached
+            if self._failed_recently(source_url):
+                return None
+
+            self.stats["misses"] += 1
+            try:
+                data, mimetype = make_thumbnail(self.fetcher(source_url), self.size)
+            except Exception:
+                self._record_failure(source_url)
+                return None
+            finally:
+                with self._lock:
+                    self._fetch_locks.pop(source_url, None)
+
+            digest = hashlib.sha256(data).hexdigest()
+            path = self._blob_path(digest, "png" if mimetype == "image/png" else "bin")
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            with open(self._index_path(source_url), "w") as f:
+                f.write(f"{digest} {mimetype}")
+
+            with self._lock:
+                if digest not in self._lru:
+                    self._total += len(data)
+                self._lru[digest] = len(data)
+                self._lru.move_to_end(digest)
+                self._evict()
+            return path, mimetype
+
+    def _evict(self):
+        while self._total > self.max_bytes and len(self._lru) > 1:
+            digest, size = self._lru.popitem(last=False)
+            self._total -= size
+            self.stats["evictions"] += 1
+            for ext in ("png", "bin"):
+                try:
+                    os.remove(self._blob_path(digest, ext))
+                except OSError:
+                    pass
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self.stats, entries=len(self._lru), bytes=self._total, max_bytes=self.max_bytes,
+                        failed_urls=len(self._failures))
+
+def avatar_version(source_url: str) -> str:
+    # Changes whenever the user's avatar_url changes, so the local URL can be cached forever
+    return url_key(source_url)[:12]
@@ -0,0 +1,81 @@
+import logging
+import threading
+import time
+from typing import Callable, List
+
+# Collects global chat room messages for up to one tick and broadcasts them
+# as a single 'chatroom:batch' frame. Socket.IO encodes each emit once and
+# writes the same packet to every client, so per-client send work drops from
+# one frame per message to one frame per tick. A batch is flushed early once
+# it reaches max_batch messages.
+
+logger = logging.getLogger('chatroom.broadcast')
+
+class TickBatcher:
+    def __init__(self, emit_fn: Callable[[str, dict], None], event: str = 'chatroom:batch',
+                 tick: float = 0.035, max_batch: int = 100):
+        self.emit_fn = emit_fn
+        self.event = event
+        self.tick = tick
+        self.max_batch = max_batch
+        self._pending: List[dict] = []
+        self._first_at = 0.0
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stats = {'messages': 0, 'batches': 0, 'max_batch_seen': 0, 'errors': 0, 'latency_ms_total': 0.0}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='chatroom-batcher', daemon=True)
+            self._thread.start()
+
+    def add(self, message: dict):
+        with self._cond:
+            if not self._pending:
+                self._first_at = time.monotonic()
+            self._pending.append(message)
+            self._cond.notify()
+
+    def _next_batch(self) -> List[dict]:
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = self._first_at + self.tick
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            now = time.monotonic()
+            self.stats['latency_ms_total'] += (now - self._first_at) * 1000 * len(batch)
+            # Leftovers from an early flush start their own tick now
+            self._first_at = now
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self.emit_fn(self.event, {'messages': batch})
+            except Exception:
+                # Keep the thread alive; only this tick's batch is lost
+                logger.exception('Chatroom batch broadcast failed', extra={'batch_size': len(batch)})
+                with self._cond:
+                    self.stats['errors'] += 1
+                continue
+            with self._cond:
+                self.stats['messages'] += len(batch)
+                self.stats['batches'] += 1
+                self.stats['max_batch_seen'] = max(self.stats['max_batch_seen'], len(batch))
+
+    def get_stats(self) -> dict:
+        with self._cond:
+            stats = dict(self.stats, pending=len(self._pending), tick_ms=self.tick * 1000, max_batch=self.max_batch)
+        latency_total = stats.pop('latency_ms_total')
+        stats['avg_batch_size'] = round(stats['messages'] / stats['batches'], 2) if stats['batches'] else None
+        # Upper bound: every message is charged from the first message of its batch
+        stats['avg_wait_ms'] = round(latency_total / stats['messages'], 3) if stats['messages'] else None
+        return stats
@@ -0,0 +1,106 @@
+import re
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Optional, Set
+
+# Named chat channels. Each channel is a Socket.IO room ("channel:<name>"),
+# so a message is only written to the sockets subscribed to it. The registry
+# tracks subscribers per channel and keeps a bounded buffer of the most recent
+# serialized messages, so a join is answered from memory after the first
+# load from the database.
+
+CHANNEL_NAME_RE = re.compile(r'^[a-z0-9][a-z0-9_-]{0,31}$')
+
+def channel_room(name: str) -> str:
+    return f'channel:{name}'
+
+def is_valid_channel_name(name) -> bool:
+    return isinstance(name, str) and bool(CHANNEL_NAME_RE.match(name))
+
+class ChannelRegistry:
+    def __init__(self, recent_size: int = 50):
+        self.recent_size = recent_size
+        self._subscribers: Dict[str, Set[str]] = {}  # channel -> socket ids
+        self._joined: Dict[str, Set[str]] = {}  # socket id -> channels
+        self._recent: Dict[str, deque] = {}  # channel -> recent message dicts, oldest first
+        self._ids: Dict[str, int] = {}  # channel -> Channel.id
+        self._loading: Dict[str, List[dict]] = {}  # channel -> messages appended during the first load
+        self._lock = threading.Lock()
+
+    def remember_id(self, name: str, channel_id: int):
+        with self._lock:
+            self._ids[name] = channel_id
+
+    def get_id(self, name: str) -> Optional[int]:
+        with self._lock:
+            return self._ids.get(name)
+
+    def join(self, name: str, sid: str) -> int:
+        """Returns the new subscriber count."""
+        with self._lock:
+            self._subscribers.setdefault(name, set()).add(sid)
+            self._joined.setdefault(sid, set()).add(name)
+            return len(self._subscribers[name])
+
+    def leave(self, name: str, sid: str) -> int:
+        with self._lock:
+            subscribers = self._subscribers.get(name, set())
+            subscribers.discard(sid)
+            self._joined.get(sid, set()).discard(name)
+            if not subscribers:
+                self._subscribers.pop(name, None)
+            return len(subscribers)
+
+    def leave_all(self, sid: str) -> Dict[str, int]:
+        """Drop a disconnected socket; returns {channel: remaining subscribers}."""
+        with self._lock:
+            names = self._joined.pop(sid, set())
+        return {name: self.leave(name, sid) for name in names}
+
+    def is_subscribed(self, name: str, sid: str) -> bool:
+        with self._lock:
+            return sid in self._subscribers.get(name, ())
+
+    def subscriber_count(self, name: str) -> int:
+        with self._lock:
+            return len(self._subscribers.get(name, ()))
+
+    def recent(self, name: str, load: Callable[[], List[dict]]) -> List[dict]:
+        """Recent messages, oldest first; `load` fills the buffer from the DB on first use."""
+        with self._lock:
+            buffer = self._recent.get(name)
+            if buffer is not None:
+                return list(buffer)
+            self._loading.setdefault(name, [])
+        try:
+            messages = load()
+        except Exception:
+            with self._lock:
+                self._loading.pop(name, None)
+            raise
+        with self._lock:
+            buffer = self._recent.get(name)
+            if buffer is None:
+                # Messages sent while the load ran may be missing from its result
+                loaded_ids = {message['id'] for message in messages}
+                pending = [m for m in self._loading.pop(name, []) if m['id'] not in loaded_ids]
+                merged = sorted(messages + pending, key=lambda message: message['id'])
+                buffer = self._recent[name] = deque(merged, maxlen=self.recent_size)
+            return list(buffer)
+
+    def append(self, name: str, message: dict):
+        with self._lock:
+            buffer = self._recent.get(name)
+            if buffer is not None:
+                buffer.append(message)
+            elif name in self._loading:
+                self._loading[name].append(message)
+            # Otherwise the buffer is filled from the DB on the next join
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'channels': {name: len(sids) for name, sids in self._subscribers.items()},
+                'buffered_channels': len(self._recent),
+                'sockets': len(self._joined),
+            }
@@ -0,0 +1,179 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# HTTP compression. Dynamic responses (JSON pages, message history) are
+# compressed in an after_request hook when they are large enough to benefit.
+# The page shell and static assets rarely change, so they are encoded once at
+# the highest level, kept in memory, and served with a content-hash ETag;
+# static URLs carry that hash as ?v=, so the browser may cache them forever.
+
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/javascript', 'application/x-ndjson',
+    'application/xml', 'image/svg+xml',
+}
+
+def is_compressible(mimetype: Optional[str]) -> bool:
+    return bool(mimetype) and (mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES)
+
+def available_encodings() -> Tuple[str, ...]:
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def choose_encoding(accept_encoding: str, available: Tuple[str, ...] = None) -> Optional[str]:
+    """Best encoding the client accepts (q > 0), in server preference order."""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    for encoding in available or available_encodings():
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > 0:
+            return encoding
+    return None
+
+def encode(body: bytes, encoding: str, level: int) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=level)
+    # mtime=0 keeps the output (and its ETag) stable across restarts
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+class ResponseCompressor:
+    def __init__(self, min_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.min_size = min_size
+        self.levels = {'gzip': gzip_level, 'br': brotli_quality}
+        self._lock = threading.Lock()
+        self.stats = {'compressed': 0, 'skipped_small': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+    def process(self, response, accept_encoding: str):
+        """Compress a buffered response in place if the client and content allow it."""
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or 'Content-Encoding' in response.headers
+                or 'Accept-Encoding' in response.vary  # already negotiated
+                or not is_compressible(response.mimetype)):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            return response
+
+        body = response.get_data()
+        if len(body) < self.min_size:
+            with self._lock:
+                self.stats['skipped_small'] += 1
+            return response
+
+        compressed = encode(body, encoding, self.levels[encoding])
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        if response.headers.get('ETag'):
+            # Different bytes than the identity representation
+            response.set_etag(f'{response.get_etag()[0]}-{encoding}', weak=True)
+        with self._lock:
+            self.stats['compressed'] += 1
+            self.stats['bytes_in'] += len(body)
+            self.stats['bytes_out'] += len(compressed)
+        return response
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats['min_size'] = self.min_size
+        stats['encodings'] = list(available_encodings())
+        stats['ratio'] = round(stats['bytes_out'] / stats['bytes_in'], 3) if stats['bytes_in'] else None
+        return stats
+
+class PrecompressedBody:
+    """A body encoded once in every available encoding."""
+
+    def __init__(self, body: bytes, mimetype: str, min_size: int = 1024):
+        self.mimetype = mimetype
+        self.etag = hashlib.sha256(body).hexdigest()[:16]
+        self.variants: Dict[Optional[str], bytes] = {None: body}
+        if is_compressible(mimetype) and len(body) >= min_size:
+            for encoding in available_encodings():
+                level = 11 if encoding == 'br' else 9
+                encoded = encode(body, encoding, level)
+                if len(encoded) < len(body):
+                    self.variants[encoding] = encoded
+
+    def select(self, accept_encoding: str) -> Tuple[bytes, Optional[str]]:
+        encoding = choose_encoding(accept_encoding, tuple(e for e in self.variants if e))
+        return self.variants[encoding], encoding
+
+class ShellCache:
+    """Rendered page shell, re-rendered only when `key_fn()` changes."""
+
+    def __init__(self, min_size: int = 1024):
+        self.min_size = min_size
+        self._key = None
+        self._body: Optional[PrecompressedBody] = None
+        self._lock = threading.Lock()
+        self.renders = 0
+
+    def get(self, key_fn: Callable[[], tuple], render: Callable[[], str]) -> PrecompressedBody:
+        with self._lock:
+            if self._body is None or self._key != key_fn():
+                self._body = PrecompressedBody(render().encode('utf-8'), 'text/html', self.min_size)
+                # Taken after rendering, which may load the assets the page references
+                self._key = key_fn()
+                self.renders += 1
+            return self._body
+
+class StaticAssets:
+    """Static files held in memory with their content hash and encoded variants."""
+
+    def __init__(self, root: str, min_size: int = 1024):
+        self.root = root
+        self.min_size = min_size
+        self._assets: Dict[str, Tuple[float, PrecompressedBody]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, filename: str) -> Optional[PrecompressedBody]:
+        path = safe_join(self.root, filename)
+        if path is None or not os.path.isfile(path):
+            return None
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._assets.get(filename)
+            if cached and cached[0] == mtime:
+                return cached[1]
+        with open(path, 'rb') as f:
+            body = f.read()
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        asset = PrecompressedBody(body, mimetype, self.min_size)
+        with self._lock:
+            self._assets[filename] = (mtime, asset)
+        return asset
+
+    def version(self, filename: str) -> str:
+        asset = self.get(filename)
+        return asset.etag if asset else '0'
+
+    def versions(self) -> Tuple[Tuple[str, str], ...]:
+        """Current version of every loaded asset; changes whenever one of them does."""
+        with self._lock:
+            names = sorted(self._assets)
+        return tuple((name, self.version(name)) for name in names)
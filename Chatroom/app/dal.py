@@ -1,5 +1,9 @@
-from sqlalchemy.orm import Session
-from .models import User, FriendRequest, Friendship, Conversation, ConversationParticipant, Message, MessageRead
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+from .archive import list_archived_messages
+from .membership import membership_cache
+from .models import User, FriendRequest, Friendship, Conversation, ConversationParticipant, Message, MessageRead, Channel, ChannelMessage, ContentType, Attachment, AttachmentConversation, Upload
 from typing import List, Tuple, Optional
 from datetime import datetime, timezone
 
@@ -120,24 +124,133 @@ def get_or_create_direct_conversation(db: Session, user_id_a: int, user_id_b: in
     db.add(ConversationParticipant(conversation_id=conversation.id, user_id=user_id_b))
 
     db.commit()
+    membership_cache.added(conversation.id, [user_id_a, user_id_b])
     return conversation.id
 
+def create_group_conversation(db: Session, creator_id: int, name: str, member_ids: List[int]) -> Conversation:
+    conversation = Conversation(type="group", name=name)
+    db.add(conversation)
+    db.flush()  # Get the ID
+
+    user_ids = {creator_id, *member_ids}
+    db.execute(insert(ConversationParticipant), [
+        {'conversation_id': conversation.id, 'user_id': uid} for uid in sorted(user_ids)
+    ])
+    db.commit()
+    membership_cache.added(conversation.id, user_ids)
+    return conversation
+
+def get_conversation(db: Session, conversation_id: int) -> Optional[Conversation]:
+    return db.query(Conversation).filter(Conversation.id == conversation_id).first()
+
+def get_participant_ids(db: Session, conversation_id: int) -> List[int]:
+    return sorted(membership_cache.members(db, conversation_id))
+
+def get_user_conversation_ids(db: Session, user_id: int) -> List[int]:
+    return sorted(membership_cache.conversations_of(db, user_id))
+
+def is_participant(db: Session, conversation_id: int, user_id: int) -> bool:
+    return membership_cache.is_member(db, conversation_id, user_id)
+
+def add_participants(db: Session, conversation_id: int, user_ids: List[int]) -> List[int]:
+    """Add users to a conversation, returns the ids that were not already members."""
+    existing = set(get_participant_ids(db, conversation_id))
+    added = sorted(set(user_ids) - existing)
+    if added:
+        db.execute(insert(ConversationParticipant), [
+            {'conversation_id': conversation_id, 'user_id': uid} for uid in added
+        ])
+        db.commit()
+        membership_cache.added(conversation_id, added)
+    return added
+
+def remove_participant(db: Session, conversation_id: int, user_id: int) -> bool:
+    removed = db.query(ConversationParticipant).filter(
+        ConversationParticipant.conversation_id == conversation_id,
+        ConversationParticipant.user_id == user_id
+    ).delete()
+    db.commit()
+    membership_cache.removed(conversation_id, [user_id])
+    return removed > 0
+
 # Message functions
-def save_message(db: Session, conversation_id: int, sender_id: int, content: str) -> Message:
+def save_message(db: Session, conversation_id: int, sender_id: int, content: str,
+                 content_type: ContentType = ContentType.text, attachment_id: int = None) -> Message:
     message = Message(
         conversation_id=conversation_id,
         sender_id=sender_id,
-        content=content
+        content=content,
+        content_type=content_type,
+        attachment_id=attachment_id
     )
     db.add(message)
     db.commit()
     db.refresh(message)
+    if attachment_id is not None:
+        link_attachment(db, attachment_id, conversation_id)
     return message
 
-def list_messages(db: Session, conversation_id: int, limit: int = 50, offset: int = 0) -> List[Message]:
-    return db.query(Message).filter(
+def list_messages(db: Session, conversation_id: int, limit: int = 50, offset: int = 0,
+                  before_id: Optional[int] = None) -> List[Message]:
+    query = db.query(Message).options(
+        joinedload(Message.sender), joinedload(Message.attachment).joinedload(Attachment.blob)
+    ).filter(
         Message.conversation_id == conversation_id
-    ).order_by(Message.created_at.desc()).offset(offset).limit(limit).all()
+    )
+    if before_id is not None:
+        query = query.filter(Message.id < before_id)
+    messages = query.order_by(Message.id.desc()).offset(offset).limit(limit).all()
+
+    # Page runs past the hot window: continue from the archive segments
+    if len(messages) < limit:
+        archive_offset = 0
+        if offset and not messages:
+            archive_offset = max(0, offset - query.count())
+        archive_before = messages[-1].id if messages else before_id
+        if archive_before is None:
+            archive_before = db.query(func.min(Message.id)).filter(
+                Message.conversation_id == conversation_id
+            ).scalar()
+        messages += list_archived_messages(
+            db, conversation_id, limit=limit - len(messages),
+            offset=archive_offset, before_id=archive_before
+        )
+    return messages
+
+# Attachment functions
+def get_attachment(db: Session, attachment_id: int) -> Optional[Attachment]:
+    return db.query(Attachment).filter(Attachment.id == attachment_id).first()
+
+def get_upload(db: Session, upload_id: str, user_id: int) -> Optional[Upload]:
+    return db.query(Upload).filter(Upload.id == upload_id, Upload.user_id == user_id).first()
+
+def link_attachment(db: Session, attachment_id: int, conversation_id: int):
+    """Record that an attachment was sent in a conversation; its members may download it."""
+    if db.get(AttachmentConversation, (attachment_id, conversation_id)):
+        return
+    db.add(AttachmentConversation(attachment_id=attachment_id, conversation_id=conversation_id))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Linked by a concurrent message
+        db.rollback()
+
+def can_access_attachment(db: Session, attachment_id: int, user_id: int) -> bool:
+    """Users who uploaded the file, or who are in a conversation where it was sent (archived or not)."""
+    uploaded = db.query(Attachment.id).filter(
+        Attachment.id == attachment_id,
+        Attachment.uploader_id == user_id
+    ).first()
+    if uploaded:
+        return True
+    shared = db.query(AttachmentConversation.conversation_id).join(
+        ConversationParticipant,
+        ConversationParticipant.conversation_id == AttachmentConversation.conversation_id
+    ).filter(
+        AttachmentConversation.attachment_id == attachment_id,
+        ConversationParticipant.user_id == user_id
+    ).first()
+    return shared is not None
 
 def mark_read(db: Session, message_id: int, user_id: int):
     # Check if already marked as read
@@ -185,7 +298,7 @@ def get_conversations(db: Session, user_id: int) -> List[dict]:
         # Get last message
         last_message = db.query(Message).filter(
             Message.conversation_id == conv.id
-        ).order_by(Message.created_at.desc()).first()
+        ).order_by(Message.id.desc()).first()
 
         result.append({
             'id': conv.id,
@@ -199,4 +312,105 @@ def get_conversations(db: Session, user_id: int) -> List[dict]:
             } if last_message else None
         })
 
-    return result
\ No newline at end of file
+    return result
+
+def get_friend_requests_with_users(db: Session, user_id: int) -> Tuple[List[FriendRequest], List[FriendRequest]]:
+    """Pending requests in both directions with from_user/to_user loaded, in one query."""
+    requests = db.query(FriendRequest).options(
+        joinedload(FriendRequest.from_user), joinedload(FriendRequest.to_user)
+    ).filter(
+        (FriendRequest.to_user_id == user_id) | (FriendRequest.from_user_id == user_id),
+        FriendRequest.status == "pending"
+    ).all()
+
+    received = [r for r in requests if r.to_user_id == user_id]
+    sent = [r for r in requests if r.from_user_id == user_id]
+    return received, sent
+
+def get_conversation_summaries(db: Session, user_id: int) -> List[dict]:
+    """Conversation list with participants, last message and unread count.
+
+    Uses four queries regardless of how many conversations the user has.
+    Sorted by most recent activity first.
+    """
+    conversations = db.query(Conversation).join(ConversationParticipant).filter(
+        ConversationParticipant.user_id == user_id
+    ).all()
+    if not conversations:
+        return []
+    conv_ids = [conv.id for conv in conversations]
+
+    participants = {conv_id: [] for conv_id in conv_ids}
+    for conv_id, user in db.query(ConversationParticipant.conversation_id, User).join(
+        User, User.id == ConversationParticipant.user_id
+    ).filter(
+        ConversationParticipant.conversation_id.in_(conv_ids),
+        User.id != user_id
+    ).all():
+        participants[conv_id].append(user)
+
+    last_ids = db.query(func.max(Message.id)).filter(
+        Message.conversation_id.in_(conv_ids)
+    ).group_by(Message.conversation_id).subquery()
+    last_messages = {
+        msg.conversation_id: msg
+        for msg in db.query(Message).filter(Message.id.in_(select(last_ids))).all()
+    }
+
+    unread_counts = dict(db.query(Message.conversation_id, func.count(Message.id)).filter(
+        Message.conversation_id.in_(conv_ids),
+        Message.sender_id != user_id,
+        ~Message.id.in_(
+            db.query(MessageRead.message_id).filter(MessageRead.user_id == user_id)
+        )
+    ).group_by(Message.conversation_id).all())
+
+    result = [{
+        'conversation': conv,
+        'participants': participants[conv.id],
+        'last_message': last_messages.get(conv.id),
+        'unread_count': unread_counts.get(conv.id, 0)
+    } for conv in conversations]
+    result.sort(key=lambda c: c['last_message'].id if c['last_message'] else 0, reverse=True)
+    return result
+
+# Channel functions
+def get_channel_by_name(db: Session, name: str) -> Optional[Channel]:
+    return db.query(Channel).filter(Channel.name == name).first()
+
+def get_or_create_channel(db: Session, name: str, created_by: int = None) -> Channel:
+    channel = get_channel_by_name(db, name)
+    if channel:
+        return channel
+    channel = Channel(name=name, created_by=created_by)
+    db.add(channel)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Created by a concurrent first join
+        db.rollback()
+        return get_channel_by_name(db, name)
+    db.refresh(channel)
+    return channel
+
+def count_channels_created_by(db: Session, user_id: int) -> int:
+    return db.query(Channel).filter(Channel.created_by == user_id).count()
+
+def list_channels(db: Session) -> List[Channel]:
+    return db.query(Channel).order_by(Channel.name).all()
+
+def save_channel_message(db: Session, channel_id: int, sender_id: int, content: str) -> ChannelMessage:
+    message = ChannelMessage(channel_id=channel_id, sender_id=sender_id, content=content)
+    db.add(message)
+    db.commit()
+    db.refresh(message)
+    return message
+
+def list_channel_messages(db: Session, channel_id: int, limit: int = 50,
+                          before_id: Optional[int] = None) -> List[ChannelMessage]:
+    query = db.query(ChannelMessage).options(joinedload(ChannelMessage.sender)).filter(
+        ChannelMessage.channel_id == channel_id
+    )
+    if before_id is not None:
+        query = query.filter(ChannelMessage.id < before_id)
+    return query.order_by(ChannelMessage.id.desc()).limit(limit).all()
@@ -1,15 +1,157 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from typing import Optional
+import logging
 import os
+import re
+
+logger = logging.getLogger('chatroom.database')
 
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///chatroom_dev.db')
 
+# Connection pool limits; a short timeout lets admission control fail fast
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith('sqlite') else {}
+    connect_args={"check_same_thread": False} if DATABASE_URL.startswith('sqlite') else {},
+    **({} if ':memory:' in DATABASE_URL else {
+        'pool_size': POOL_SIZE,
+        'max_overflow': MAX_OVERFLOW,
+        'pool_timeout': POOL_TIMEOUT
+    })
 )
 
+# New SQLite databases reclaim free pages with the scheduled incremental vacuum.
+# Existing ones keep their mode until a forced full vacuum converts them.
+# Registered before the WAL hook: auto_vacuum is fixed once the file is initialized.
+if DATABASE_URL.startswith('sqlite'):
+    @event.listens_for(engine, 'connect')
+    def _incremental_auto_vacuum(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if cursor.execute('SELECT count(*) FROM sqlite_master').fetchone()[0] == 0:
+            cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        cursor.close()
+
+# WAL lets readers proceed while a writer commits; the maintenance scheduler
+# checkpoints the log so it does not grow without bound.
+if DATABASE_URL.startswith('sqlite') and ':memory:' not in DATABASE_URL and os.getenv('SQLITE_WAL', '1') == '1':
+    @event.listens_for(engine, 'connect')
+    def _enable_wal(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+def add_missing_columns(table):
+    """create_all() never alters existing tables; add columns that are new in the model in place."""
+    existing = {col['name'] for col in inspect(engine).get_columns(table.name)}
+    with engine.begin() as conn:
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}'
+            if column.server_default is not None:
+                ddl += f" DEFAULT '{column.server_default.arg}'"
+            conn.execute(text(ddl))
+
+def _autoincrement_ddl(ddl: str, table_name: str, pk: str) -> Optional[str]:
+    """The table's own CREATE statement, renamed to <table>_rebuild, with `pk` as INTEGER PRIMARY KEY AUTOINCREMENT.
+    None if the statement does not have a form we know how to rewrite."""
+    column = re.compile(rf'([(,]\s*"?{pk}"?\s+INTEGER)((?:\s+NOT NULL)?)(\s+PRIMARY KEY)?(?=\s*[,)])', re.I)
+    match = column.search(ddl)
+    if not match:
+        return None
+    if match.group(3):
+        ddl = column.sub(r'\1\2\3 AUTOINCREMENT', ddl, count=1)
+    else:
+        constraint = re.compile(rf',\s*PRIMARY KEY\s*\(\s*"?{pk}"?\s*\)', re.I)
+        if not constraint.search(ddl):
+            return None
+        ddl = constraint.sub('', ddl, count=1)
+        ddl = column.sub(r'\1\2 PRIMARY KEY AUTOINCREMENT', ddl, count=1)
+    return re.sub(rf'^\s*CREATE TABLE\s+"?{table_name}"?', f'CREATE TABLE {table_name}_rebuild', ddl, count=1, flags=re.I)
+
+def ensure_sqlite_autoincrement(table, min_sequence: int = 0):
+    """Give an existing SQLite table an AUTOINCREMENT primary key so deleted ids are never handed out again,
+    and raise its sqlite_sequence to at least `min_sequence`.
+
+    SQLite cannot alter a primary key, so the table is rebuilt from its own CREATE statement (not the
+    model): every existing column, constraint, index and trigger is kept. The rebuild runs in one
+    transaction and is rolled back unless the copy has the same columns and row count."""
+    if engine.dialect.name != 'sqlite':
+        return
+    raw = engine.raw_connection()
+    dbapi_connection = raw.driver_connection
+    isolation_level = dbapi_connection.isolation_level
+    dbapi_connection.isolation_level = None  # explicit BEGIN / COMMIT below, DDL included
+    cursor = dbapi_connection.cursor()
+    try:
+        ddl = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                             (table.name,)).fetchone()
+        if not ddl:
+            return
+        ddl = ddl[0]
+        if 'AUTOINCREMENT' not in ddl.upper():
+            pk = [column.name for column in table.primary_key.columns]
+            rebuild = _autoincrement_ddl(ddl, table.name, pk[0]) if len(pk) == 1 else None
+            if rebuild is None:
+                logger.warning('Cannot add AUTOINCREMENT, ids may be reused', extra={'table': table.name})
+                return
+            _rebuild_table(cursor, table.name, rebuild)
+
+        cursor.execute('BEGIN IMMEDIATE')
+        current = cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table.name,)).fetchone()
+        if current is None:
+            high = cursor.execute(f'SELECT max(rowid) FROM "{table.name}"').fetchone()[0] or 0
+            cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)',
+                           (table.name, max(high, min_sequence)))
+        elif current[0] < min_sequence:
+            cursor.execute('UPDATE sqlite_sequence SET seq = ? WHERE name = ?', (min_sequence, table.name))
+        cursor.execute('COMMIT')
+    except Exception:
+        if dbapi_connection.in_transaction:
+            cursor.execute('ROLLBACK')
+        raise
+    finally:
+        cursor.close()
+        dbapi_connection.isolation_level = isolation_level
+        raw.close()
+
+def _rebuild_table(cursor, name: str, create_sql: str):
+    """Create <name>_rebuild from `create_sql`, copy every row, and swap it in for `name`."""
+    tmp = f'{name}_rebuild'
+    columns = [row[1] for row in cursor.execute(f'PRAGMA table_info("{name}")')]
+    extras = [row[0] for row in cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+        (name,))]
+    foreign_keys = cursor.execute('PRAGMA foreign_keys').fetchone()[0]
+    cursor.execute('PRAGMA foreign_keys = OFF')  # no effect inside a transaction
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute(create_sql)
+        column_list = ', '.join(f'"{column}"' for column in columns)
+        cursor.execute(f'INSERT INTO "{tmp}" ({column_list}) SELECT {column_list} FROM "{name}"')
+        copied = [row[1] for row in cursor.execute(f'PRAGMA table_info("{tmp}")')]
+        rows = cursor.execute(f'SELECT count(*) FROM "{name}"').fetchone()[0]
+        if copied != columns or cursor.execute(f'SELECT count(*) FROM "{tmp}"').fetchone()[0] != rows:
+            raise RuntimeError(f'Rebuilding {name} would change its columns or rows')
+        cursor.execute(f'DROP TABLE "{name}"')
+        cursor.execute(f'ALTER TABLE "{tmp}" RENAME TO "{name}"')
+        for sql in extras:
+            cursor.execute(sql)
+        if cursor.execute('PRAGMA foreign_key_check').fetchone():
+            raise RuntimeError(f'Rebuilding {name} broke a foreign key')
+        cursor.execute('COMMIT')
+    except Exception:
+        cursor.execute('ROLLBACK')
+        raise
+    finally:
+        cursor.execute(f'PRAGMA foreign_keys = {foreign_keys}')
+    logger.info('Rebuilt table with AUTOINCREMENT', extra={'table': name, 'rows': rows})
@@ -0,0 +1,78 @@
+import json
+import zlib
+from typing import Iterable, Iterator
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .archive import iter_archived_rows
+from .models import User, Attachment, Message, ConversationParticipant
+from .serializers import serialize_message
+
+# Exports never build ORM objects: rows are read in chunks with the sender
+# columns joined in and turned into NDJSON lines one at a time, so memory use
+# does not depend on the size of the conversation.
+
+DEFAULT_CHUNK_SIZE = 1000
+
+def _row_to_dict(row, content, attachment) -> dict:
+    sender = {
+        'id': row.sender_id,
+        'display_name': row.display_name,
+        'avatar_url': row.avatar_url
+    }
+    return serialize_message(row, sender, attachment, content=content)
+
+def iter_conversation_messages(db: Session, conversation_id: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[dict]:
+    """Oldest-first stream of every message in a conversation, archived ones included."""
+    attachments = {}  # few per conversation; each is loaded once
+
+    def attachment_for(row):
+        if row.attachment_id is None:
+            return None
+        if row.attachment_id not in attachments:
+            attachments[row.attachment_id] = db.get(Attachment, row.attachment_id)
+        return attachments[row.attachment_id]
+
+    for row, content in iter_archived_rows(db, conversation_id, chunk_size):
+        yield _row_to_dict(row, content, attachment_for(row))
+
+    result = db.execute(
+        select(Message.id, Message.conversation_id, Message.sender_id, Message.created_at, Message.content,
+               Message.content_type, Message.attachment_id, User.display_name, User.avatar_url)
+        .join(User, User.id == Message.sender_id)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    for row in result:
+        yield _row_to_dict(row, row.content, attachment_for(row))
+
+def iter_user_messages(db: Session, user_id: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[dict]:
+    conversation_ids = db.execute(
+        select(ConversationParticipant.conversation_id)
+        .where(ConversationParticipant.user_id == user_id)
+        .order_by(ConversationParticipant.conversation_id)
+    ).scalars().all()
+    for conversation_id in conversation_ids:
+        yield from iter_conversation_messages(db, conversation_id, chunk_size)
+
+def iter_ndjson(records: Iterable[dict], batch_size: int = 100) -> Iterator[bytes]:
+    """Encode records as NDJSON, emitting one bytes chunk per batch_size lines."""
+    lines = []
+    for record in records:
+        lines.append(json.dumps(record, ensure_ascii=False))
+        if len(lines) >= batch_size:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+def iter_gzip(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Streaming gzip encoder for an iterable of byte chunks."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,116 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+# Log calls only enqueue the record; a single QueueListener thread serializes
+# records to JSON lines and writes them to stdout (the pipe electron-main.js
+# reads), so a slow pipe reader never blocks socket handlers.
+
+# Per-subsystem defaults, overridable with LOG_LEVELS="chatroom.socket=DEBUG,engineio=INFO"
+DEFAULT_LEVELS = {
+    'chatroom': 'INFO',
+    'chatroom.messages': 'INFO',
+    'socketio': 'WARNING',
+    'engineio': 'WARNING',
+    'sqlalchemy.engine': 'WARNING',
+    'werkzeug': 'WARNING',
+}
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+REDACTED_FIELDS = ('content',)
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Keep roughly `rate` of the records below WARNING; warnings and errors always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+class RedactFilter(logging.Filter):
+    """Replace message content passed via `extra=` with its length."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for field in REDACTED_FIELDS:
+            value = getattr(record, field, None)
+            if isinstance(value, str):
+                setattr(record, field, f'<redacted {len(value)} chars>')
+        return True
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock prepare() runs a Formatter and copies the record on the
+        # caller's thread; merging the args is all the listener needs.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.msg = f'{record.msg}\n{record.exc_text}'
+            record.exc_info = None
+        return record
+
+def parse_levels(value: str) -> Dict[str, str]:
+    levels = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, level = item.partition('=')
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+_listener: Optional[QueueListener] = None
+
+def configure_logging(stream=None) -> QueueListener:
+    """Route all logging through a background queue listener. Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    levels = dict(DEFAULT_LEVELS)
+    levels.update(parse_levels(os.getenv('LOG_LEVELS', '')))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    # Unbounded so logging never blocks the caller; sampling keeps it small
+    log_queue = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    if os.getenv('LOG_REDACT_CONTENT', '0') == '1':
+        handler.addFilter(RedactFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(logging.INFO)
+
+    sample_rate = float(os.getenv('LOG_SAMPLE_MESSAGES', '1.0'))
+    if sample_rate < 1.0:
+        logging.getLogger('chatroom.messages').addFilter(SamplingFilter(sample_rate))
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
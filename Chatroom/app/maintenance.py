@@ -0,0 +1,303 @@
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+import requests
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+
+from .attachments import attachment_root, expire_uploads
+from .models import FriendRequest, MaintenanceLock, MaintenanceRun
+
+# Periodic database maintenance. Each job runs on its own interval (with
+# jitter so several workers do not line up), only while the server reports
+# low load, and under a row lock in maintenance_locks so two processes never
+# run the same job at once. Every run is recorded in maintenance_runs with its
+# duration and a JSON summary of what it changed.
+
+logger = logging.getLogger('chatroom.maintenance')
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# Jobs: each takes (engine, db) and returns a JSON-serializable summary
+
+def job_analyze(engine, db: Session) -> dict:
+    with engine.connect() as conn:
+        conn.execute(text('ANALYZE'))
+        conn.commit()
+        stats = conn.execute(text('SELECT count(*) FROM sqlite_stat1')).scalar() \
+            if engine.dialect.name == 'sqlite' else None
+    return {'stat_rows': stats}
+
+def job_wal_checkpoint(engine, db: Session) -> dict:
+    if engine.dialect.name != 'sqlite':
+        return {'skipped': 'not sqlite'}
+    with engine.connect() as conn:
+        mode = conn.execute(text('PRAGMA journal_mode')).scalar()
+        if mode != 'wal':
+            return {'skipped': f'journal_mode={mode}'}
+        busy, log_frames, checkpointed = conn.execute(text('PRAGMA wal_checkpoint(TRUNCATE)')).one()
+    return {'busy': busy, 'log_frames': log_frames, 'checkpointed_frames': checkpointed}
+
+def job_vacuum(engine, db: Session, incremental_pages: int = 1000, full: bool = False) -> dict:
+    """Incremental vacuum on schedule. A full VACUUM rewrites the whole file and blocks
+    writers, so it only runs when forced (full=True); it also switches the database to
+    auto_vacuum=INCREMENTAL so later scheduled runs can reclaim pages."""
+    if engine.dialect.name != 'sqlite':
+        return {'skipped': 'not sqlite'}
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        auto_vacuum = conn.execute(text('PRAGMA auto_vacuum')).scalar()
+        free_before = conn.execute(text('PRAGMA freelist_count')).scalar()
+        pages_before = conn.execute(text('PRAGMA page_count')).scalar()
+        if full:
+            conn.execute(text('PRAGMA auto_vacuum = INCREMENTAL'))
+            conn.execute(text('VACUUM'))
+            mode = 'full'
+        elif auto_vacuum == 2:  # INCREMENTAL
+            # execute() steps the pragma once (one page); executescript() runs it to completion
+            conn.connection.driver_connection.executescript(f'PRAGMA incremental_vacuum({int(incremental_pages)});')
+            mode = 'incremental'
+        else:
+            return {'skipped': 'auto_vacuum is not INCREMENTAL, run a forced full vacuum once',
+                    'free_pages': free_before}
+        free_after = conn.execute(text('PRAGMA freelist_count')).scalar()
+        pages_after = conn.execute(text('PRAGMA page_count')).scalar()
+    return {
+        'mode': mode,
+        'free_pages_before': free_before,
+        'free_pages_after': free_after,
+        'pages_released': pages_before - pages_after,
+    }
+
+def job_cleanup_friend_requests(engine, db: Session, answered_days: int = 30, pending_days: int = 90) -> dict:
+    now = _utcnow()
+    answered = db.query(FriendRequest).filter(
+        FriendRequest.status != 'pending',
+        FriendRequest.created_at < now - timedelta(days=answered_days)
+    ).delete(synchronize_session=False)
+    expired = db.query(FriendRequest).filter(
+        FriendRequest.status == 'pending',
+        FriendRequest.created_at < now - timedelta(days=pending_days)
+    ).delete(synchronize_session=False)
+    db.commit()
+    return {'answered_deleted': answered, 'expired_pending_deleted': expired}
+
+def job_expire_uploads(engine, db: Session) -> dict:
+    max_age = timedelta(hours=float(os.getenv('UPLOAD_EXPIRY_HOURS', '24')))
+    return expire_uploads(db, attachment_root(), _utcnow() - max_age)
+
+class Job:
+    def __init__(self, name: str, func: Callable, interval: float):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.next_run = 0.0
+
+def default_jobs() -> List[Job]:
+    def hours(key, default):
+        return float(os.getenv(key, default)) * 3600
+
+    return [
+        Job('analyze', job_analyze, hours('MAINTENANCE_ANALYZE_HOURS', '6')),
+        Job('wal_checkpoint', job_wal_checkpoint, hours('MAINTENANCE_CHECKPOINT_HOURS', '0.25')),
+        Job('vacuum', job_vacuum, hours('MAINTENANCE_VACUUM_HOURS', '24')),
+        Job('cleanup_friend_requests', job_cleanup_friend_requests, hours('MAINTENANCE_CLEANUP_HOURS', '12')),
+        Job('expire_uploads', job_expire_uploads, hours('MAINTENANCE_UPLOADS_HOURS', '1')),
+    ]
+
+class WriteActivity:
+    """Idle signal for a worker outside the app process: rows written per minute to the
+    busiest tables, measured between polls. A stale or missing sample counts as busy, so
+    a job that comes due is only run once a fresh window shows low load."""
+
+    def __init__(self, engine, tables=('messages', 'channel_messages'), max_per_minute: float = 30.0,
+                 window: float = 90.0, min_interval: float = 5.0):
+        self.engine = engine
+        self.tables = tables
+        self.max_per_minute = max_per_minute
+        self.window = window
+        self.min_interval = min_interval
+        self.last_rate = None
+        self._sample = None  # (monotonic time, total of max rowids)
+        self._idle = False
+
+    def _high_water(self) -> int:
+        total = 0
+        with self.engine.connect() as conn:
+            for table in self.tables:
+                try:
+                    total += conn.execute(text(f'SELECT max(rowid) FROM {table}')).scalar() or 0
+                except OperationalError:  # table not created yet
+                    conn.rollback()
+        return total
+
+    def __call__(self) -> bool:
+        now = time.monotonic()
+        if self._sample and now - self._sample[0] < self.min_interval:
+            return self._idle
+        high = self._high_water()
+        last, self._sample = self._sample, (now, high)
+        if last is None or now - last[0] > self.window:
+            self._idle = False
+        else:
+            self.last_rate = max(0, high - last[1]) * 60 / (now - last[0])
+            self._idle = self.last_rate <= self.max_per_minute
+        return self._idle
+
+def server_pressure_ok(url: str, timeout: float = 2.0) -> bool:
+    """True if the app's /api/status reports pressure 'ok'; unreachable counts as busy."""
+    try:
+        response = requests.get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.json().get('pressure') == 'ok'
+    except (requests.RequestException, ValueError):
+        logger.warning('Server status unavailable, maintenance deferred', extra={'url': url})
+        return False
+
+class MaintenanceScheduler:
+    def __init__(self, engine, session_factory, jobs: List[Job], is_idle: Callable[[], bool] = lambda: True,
+                 jitter: float = 0.1, poll_interval: float = 30.0, lock_ttl: float = 3600.0):
+        self.engine = engine
+        self.session_factory = session_factory
+        self.jobs = {job.name: job for job in jobs}
+        self.is_idle = is_idle
+        self.jitter = jitter
+        self.poll_interval = poll_interval
+        self.lock_ttl = lock_ttl
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _schedule(self, job: Job, after: float):
+        spread = after * self.jitter
+        job.next_run = time.monotonic() + after + random.uniform(-spread, spread)
+
+    def _try_lock(self, db: Session, name: str) -> bool:
+        now = _utcnow()
+        expires = now + timedelta(seconds=self.lock_ttl)
+        updated = db.query(MaintenanceLock).filter(
+            MaintenanceLock.job == name,
+            (MaintenanceLock.expires_at < now) | (MaintenanceLock.owner == self.owner)
+        ).update({'owner': self.owner, 'expires_at': expires}, synchronize_session=False)
+        if not updated:
+            db.add(MaintenanceLock(job=name, owner=self.owner, expires_at=expires))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return False
+        return True
+
+    def _unlock(self, db: Session, name: str):
+        db.query(MaintenanceLock).filter(
+            MaintenanceLock.job == name,
+            MaintenanceLock.owner == self.owner
+        ).update({'expires_at': _utcnow()}, synchronize_session=False)
+        db.commit()
+
+    def _ran_recently(self, db: Session, job: Job) -> Optional[float]:
+        """Seconds since another worker last ran the job, if within its interval."""
+        last = db.query(MaintenanceRun.started_at).filter(
+            MaintenanceRun.job == job.name,
+            MaintenanceRun.success.is_(True)
+        ).order_by(MaintenanceRun.started_at.desc()).first()
+        if last:
+            age = (_utcnow() - last[0]).total_seconds()
+            if age < job.interval:
+                return age
+        return None
+
+    def trigger(self, name: Optional[str] = None):
+        """Make a job (or every job) due on the next poll."""
+        for job in ([self.jobs[name]] if name else self.jobs.values()):
+            self._schedule(job, 0)
+
+    def run_job(self, name: str, force: bool = False, **options) -> Optional[dict]:
+        """Run one job now under the lock; `options` go to the job function.
+        Returns the recorded run, or None if skipped."""
+        job = self.jobs[name]
+        db = self.session_factory()
+        try:
+            if not force:
+                age = self._ran_recently(db, job)
+                if age is not None:
+                    self._schedule(job, job.interval - age)
+                    return None
+            if not self._try_lock(db, name):
+                logger.info('Maintenance job locked by another worker', extra={'job': name})
+                self._schedule(job, self.poll_interval)
+                return None
+
+            started_at = _utcnow()
+            start = time.perf_counter()
+            try:
+                result = job.func(self.engine, db, **options)
+                success = True
+            except Exception as e:
+                db.rollback()
+                logger.exception('Maintenance job failed', extra={'job': name})
+                result = {'error': str(e)}
+                success = False
+            duration_ms = int((time.perf_counter() - start) * 1000)
+
+            db.add(MaintenanceRun(
+                job=name, owner=self.owner, started_at=started_at,
+                duration_ms=duration_ms, success=success, result=json.dumps(result)
+            ))
+            db.commit()
+            self._unlock(db, name)
+            self._schedule(job, job.interval)
+
+            logger.info('Maintenance job finished', extra={
+                'job': name, 'duration_ms': duration_ms, 'success': success, 'result': result
+            })
+            return {'job': name, 'duration_ms': duration_ms, 'success': success, 'result': result}
+        finally:
+            db.close()
+
+    def run_pending(self):
+        now = time.monotonic()
+        for job in self.jobs.values():
+            if job.next_run > now:
+                continue
+            if not self.is_idle():
+                # Busy: check again on the next poll
+                continue
+            self.run_job(job.name)
+
+    def start(self):
+        if self._thread is None:
+            # First runs are spread over one poll interval
+            for job in self.jobs.values():
+                self._schedule(job, self.poll_interval)
+            self._thread = threading.Thread(target=self.run_forever, name='maintenance', daemon=True)
+            self._thread.start()
+
+    def run_forever(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.run_pending()
+            except Exception:
+                logger.exception('Maintenance scheduler error')
+
+    def stop(self):
+        self._stop.set()
+
+def recent_runs(db: Session, limit: int = 50) -> List[Dict]:
+    runs = db.query(MaintenanceRun).order_by(MaintenanceRun.id.desc()).limit(limit).all()
+    return [{
+        'job': run.job,
+        'owner': run.owner,
+        'started_at': run.started_at.isoformat(),
+        'duration_ms': run.duration_ms,
+        'success': run.success,
+        'result': json.loads(run.result) if run.result else None
+    } for run in runs]
@@ -0,0 +1,109 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, Set
+
+from sqlalchemy.orm import Session
+
+from .models import ConversationParticipant
+
+# In-process cache of conversation membership, shared by HTTP routes and
+# socket handlers. Entries are loaded lazily on first use and kept current by
+# the DAL functions that add or remove participants (see app/dal.py), so an
+# access check on a warm conversation costs no DB round trip.
+
+class MembershipCache:
+    def __init__(self, max_conversations: int = 10000):
+        self.max_conversations = max_conversations
+        self._members: "OrderedDict[int, Set[int]]" = OrderedDict()  # conversation -> users (LRU)
+        self._conversations: Dict[int, Set[int]] = {}  # user -> conversations, only for loaded users
+        self._lock = threading.Lock()
+        self._version = 0  # bumped on every change; loads that raced a change are not cached
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _load_members(self, db: Session, conversation_id: int) -> Set[int]:
+        version = self._version
+        user_ids = {row[0] for row in db.query(ConversationParticipant.user_id).filter(
+            ConversationParticipant.conversation_id == conversation_id
+        ).all()}
+        with self._lock:
+            if version != self._version:
+                return user_ids
+            self._members[conversation_id] = user_ids
+            self._members.move_to_end(conversation_id)
+            while len(self._members) > self.max_conversations:
+                self._members.popitem(last=False)
+                self.stats["evictions"] += 1
+        return user_ids
+
+    def members(self, db: Session, conversation_id: int) -> FrozenSet[int]:
+        with self._lock:
+            user_ids = self._members.get(conversation_id)
+            if user_ids is not None:
+                self._members.move_to_end(conversation_id)
+                self.stats["hits"] += 1
+                return frozenset(user_ids)
+            self.stats["misses"] += 1
+        return frozenset(self._load_members(db, conversation_id))
+
+    def is_member(self, db: Session, conversation_id: int, user_id: int) -> bool:
+        return user_id in self.members(db, conversation_id)
+
+    def conversations_of(self, db: Session, user_id: int) -> FrozenSet[int]:
+        with self._lock:
+            conv_ids = self._conversations.get(user_id)
+            if conv_ids is not None:
+                self.stats["hits"] += 1
+                return frozenset(conv_ids)
+            self.stats["misses"] += 1
+
+        version = self._version
+        conv_ids = {row[0] for row in db.query(ConversationParticipant.conversation_id).filter(
+            ConversationParticipant.user_id == user_id
+        ).all()}
+        with self._lock:
+            if version == self._version:
+                self._conversations[user_id] = conv_ids
+        return frozenset(conv_ids)
+
+    def added(self, conversation_id: int, user_ids: Iterable[int]):
+        """Record committed participant inserts."""
+        with self._lock:
+            self._version += 1
+            for user_id in user_ids:
+                if conversation_id in self._members:
+                    self._members[conversation_id].add(user_id)
+                if user_id in self._conversations:
+                    self._conversations[user_id].add(conversation_id)
+
+    def removed(self, conversation_id: int, user_ids: Iterable[int]):
+        """Record committed participant deletes."""
+        with self._lock:
+            self._version += 1
+            for user_id in user_ids:
+                if conversation_id in self._members:
+                    self._members[conversation_id].discard(user_id)
+                if user_id in self._conversations:
+                    self._conversations[user_id].discard(conversation_id)
+
+    def forget_user(self, user_id: int):
+        """Drop the per-user index, e.g. when the user goes offline."""
+        with self._lock:
+            self._conversations.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._members.clear()
+            self._conversations.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return dict(
+                self.stats,
+                conversations=len(self._members),
+                users=len(self._conversations),
+                members=sum(len(users) for users in self._members.values()),
+                hit_rate=round(self.stats["hits"] / lookups, 4) if lookups else None,
+            )
+
+membership_cache = MembershipCache()
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text
+import enum
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Boolean, Text, Index, Enum
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -46,16 +47,26 @@ class ConversationParticipant(Base):
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
 
+class ContentType(enum.Enum):
+    text = "text"
+    file = "file"
+    image = "image"
+
 class Message(Base):
     __tablename__ = "messages"
+    # Archiving can empty the table; AUTOINCREMENT keeps SQLite from reusing ids
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
     sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     content = Column(Text, nullable=False)
+    content_type = Column(Enum(ContentType), nullable=False, default=ContentType.text, server_default=ContentType.text.name)
+    attachment_id = Column(Integer, ForeignKey("attachments.id"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     sender = relationship("User")
+    attachment = relationship("Attachment")
 
 class MessageRead(Base):
     __tablename__ = "message_reads"
@@ -63,4 +74,97 @@ class MessageRead(Base):
     id = Column(Integer, primary_key=True, index=True)
     message_id = Column(Integer, ForeignKey("messages.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    read_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    read_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class MessageArchiveSegment(Base):
+    __tablename__ = "message_archive_segments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    table_name = Column(String, unique=True, nullable=False)  # messages_archive_YYYYMM
+    min_message_id = Column(Integer, nullable=False)
+    max_message_id = Column(Integer, nullable=False)
+    message_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class Channel(Base):
+    __tablename__ = "channels"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, nullable=False)
+    created_by = Column(Integer, ForeignKey("users.id"))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ChannelMessage(Base):
+    __tablename__ = "channel_messages"
+    __table_args__ = (Index("ix_channel_messages_channel_id_id", "channel_id", "id"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    channel_id = Column(Integer, ForeignKey("channels.id"), nullable=False)
+    sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    sender = relationship("User")
+
+class MaintenanceLock(Base):
+    __tablename__ = "maintenance_locks"
+
+    job = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+class MaintenanceRun(Base):
+    __tablename__ = "maintenance_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job = Column(String, nullable=False, index=True)
+    owner = Column(String, nullable=False)
+    started_at = Column(DateTime, nullable=False)
+    duration_ms = Column(Integer, nullable=False)
+    success = Column(Boolean, nullable=False, default=True)
+    result = Column(Text)  # JSON
+
+class AttachmentBlob(Base):
+    __tablename__ = "attachment_blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, nullable=False)  # content hash, used for dedup
+    size = Column(BigInteger, nullable=False)
+    image_type = Column(String)  # raster image type detected from the bytes, if any
+    storage_path = Column(String, nullable=False)
+    thumbnail_path = Column(String)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class Attachment(Base):
+    # One per completed upload: identical files share a blob, but the name and
+    # declared type stay with the user who uploaded them
+    __tablename__ = "attachments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    blob_id = Column(Integer, ForeignKey("attachment_blobs.id"), nullable=False)
+    filename = Column(String, nullable=False)
+    mime_type = Column(String, nullable=False)
+    uploader_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    blob = relationship("AttachmentBlob")
+
+class AttachmentConversation(Base):
+    # Conversations an attachment was sent in; kept when messages are archived
+    __tablename__ = "attachment_conversations"
+
+    attachment_id = Column(Integer, ForeignKey("attachments.id"), primary_key=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), primary_key=True)
+
+class Upload(Base):
+    __tablename__ = "uploads"
+
+    id = Column(String(32), primary_key=True)  # random hex, used in the upload URL
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    filename = Column(String, nullable=False)
+    mime_type = Column(String, nullable=False)
+    total_size = Column(BigInteger, nullable=False)
+    received = Column(BigInteger, nullable=False, default=0)
+    attachment_id = Column(Integer, ForeignKey("attachments.id"))  # set once complete
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
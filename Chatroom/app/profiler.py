@@ -0,0 +1,132 @@
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterable
+
+# Two tools for a live server:
+# - sample_stacks() snapshots every thread's stack with sys._current_frames()
+#   at a fixed interval and returns collapsed stacks ("a;b;c 42") that
+#   flamegraph.pl / speedscope render directly. Nothing is instrumented, so
+#   the cost is one frame walk per thread per interval.
+# - HandlerProfiler runs cProfile around individual socket events or Flask
+#   endpoints that were switched on, and keeps the stats per name. Only one
+#   profile runs at a time (Python 3.12+ allows a single active profiler per
+#   process), so a handler that overlaps a profiled one runs unprofiled and is
+#   counted as skipped.
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})"
+
+def sample_stacks(duration: float, interval: float = 0.005) -> Counter:
+    """Sample all threads except the caller for `duration` seconds."""
+    own_id = threading.get_ident()
+    names = {}
+    stacks = Counter()
+    deadline = time.monotonic() + duration
+
+    while time.monotonic() < deadline:
+        frames = sys._current_frames()
+        if len(names) != len(frames):
+            names = {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in frames.items():
+            if thread_id == own_id:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(thread_id, f"thread-{thread_id}"))
+            stacks[";".join(reversed(labels))] += 1
+        del frames
+        time.sleep(interval)
+
+    return stacks
+
+def format_collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+class HandlerProfiler:
+    def __init__(self):
+        self.enabled = set()
+        self._stats: Dict[str, pstats.Stats] = {}
+        self._calls = Counter()
+        self._skipped = Counter()
+        self._lock = threading.Lock()
+        self._active = threading.Lock()  # held while a profile is running
+
+    def enable(self, names: Iterable[str]):
+        self.enabled.update(names)
+
+    def disable(self, names: Iterable[str]):
+        self.enabled.difference_update(names)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._calls.clear()
+            self._skipped.clear()
+
+    @contextmanager
+    def profile(self, name: str):
+        profile = self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name, profile)
+
+    def start(self, name: str):
+        """Begin profiling on the current thread; pair with stop().
+
+        Returns None if the name is not enabled or another profile is already running.
+        """
+        if name not in self.enabled:
+            return None
+        if not self._active.acquire(blocking=False):
+            with self._lock:
+                self._skipped[name] += 1
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiling tool (debugger, coverage) owns the profiler hook
+            self._active.release()
+            with self._lock:
+                self._skipped[name] += 1
+            return None
+        return profile
+
+    def stop(self, name: str, profile):
+        if profile is not None:
+            profile.disable()
+            self._active.release()
+            self._record(name, profile)
+
+    def _record(self, name: str, profile: cProfile.Profile):
+        with self._lock:
+            self._calls[name] += 1
+            if name in self._stats:
+                self._stats[name].add(profile)
+            else:
+                self._stats[name] = pstats.Stats(profile)
+
+    def report(self, limit: int = 30, sort: str = "cumulative") -> Dict[str, dict]:
+        result = {}
+        with self._lock:
+            for name, stats in self._stats.items():
+                out = io.StringIO()
+                stats.stream = out
+                stats.sort_stats(sort).print_stats(limit)
+                result[name] = {
+                    "calls": self._calls[name],
+                    "skipped": self._skipped[name],
+                    "total_time": round(stats.total_tt, 6),
+                    "stats": out.getvalue(),
+                }
+        return result
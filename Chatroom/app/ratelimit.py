@@ -0,0 +1,279 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# Rate limit policies
+POLICY_DROP = "drop"    # silently ignore the event
+POLICY_DELAY = "delay"  # sleep until a token is available; rejected beyond max_delay
+POLICY_ERROR = "error"  # reject the event and tell the client when to retry
+
+# Default (tokens per second, burst size) per socket event
+DEFAULT_LIMITS = {
+    'message:send': (5.0, 10),
+    'chatroom:send': (5.0, 10),
+    'group:send': (5.0, 10),
+    'channel:send': (5.0, 10),
+    'channel:join': (1.0, 5),
+    'channel:history': (2.0, 5),
+    'typing:start': (2.0, 4),
+}
+
+def parse_limit(value: str) -> Tuple[float, int]:
+    """Parse a "rate,burst" string such as "5,10"."""
+    rate, _, burst = value.partition(',')
+    rate = float(rate)
+    return rate, int(burst) if burst else max(1, int(rate))
+
+def load_limits_from_env() -> Dict[str, Tuple[float, int]]:
+    # RATE_LIMIT_MESSAGE_SEND="5,10" overrides the 'message:send' limit
+    limits = dict(DEFAULT_LIMITS)
+    for event in DEFAULT_LIMITS:
+        key = 'RATE_LIMIT_' + event.replace(':', '_').upper()
+        if os.getenv(key):
+            limits[event] = parse_limit(os.getenv(key))
+    return limits
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, now: Optional[float] = None) -> float:
+        """Take one token. Returns 0 on success, otherwise seconds until a token is available."""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        """True once the bucket has refilled to its burst; forgetting it then changes nothing."""
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+class RateLimiter:
+    """Token buckets keyed by (user_id, event)."""
+
+    def __init__(self, limits: Dict[str, Tuple[float, int]], policy: str = POLICY_ERROR,
+                 max_delay: float = 1.0, prune_interval: float = 60.0):
+        if policy not in (POLICY_DROP, POLICY_DELAY, POLICY_ERROR):
+            raise ValueError(f"Unknown rate limit policy: {policy}")
+        self.limits = limits
+        self.policy = policy
+        self.max_delay = max_delay
+        self.prune_interval = prune_interval
+        self._buckets: Dict[Tuple[int, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._pruned_at = time.monotonic()
+        self.stats = {'allowed': 0, 'dropped': 0, 'delayed': 0, 'rejected': 0, 'pruned': 0}
+        self.stats_by_event: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, event: str, key: str):
+        self.stats[key] += 1
+        per_event = self.stats_by_event.setdefault(
+            event, {'allowed': 0, 'dropped': 0, 'delayed': 0, 'rejected': 0})
+        per_event[key] += 1
+
+    def check(self, user_id: int, event: str) -> Tuple[bool, float]:
+        """Returns (allowed, retry_after). May sleep when the policy is delay."""
+        limit = self.limits.get(event)
+        if limit is None:
+            return True, 0.0
+
+        with self._lock:
+            self._prune()
+            bucket = self._buckets.get((user_id, event))
+            if bucket is None:
+                bucket = self._buckets[(user_id, event)] = TokenBucket(*limit)
+            wait = bucket.take()
+            if wait == 0:
+                self._count(event, 'allowed')
+                return True, 0.0
+
+            if self.policy == POLICY_DELAY and wait <= self.max_delay:
+                # Reserve the token now so concurrent callers queue up behind us
+                bucket.tokens -= 1
+                self._count(event, 'delayed')
+            elif self.policy == POLICY_DROP:
+                self._count(event, 'dropped')
+                return False, wait
+            else:
+                self._count(event, 'rejected')
+                return False, wait
+
+        time.sleep(wait)
+        return True, 0.0
+
+    def _prune(self):
+        """Drop idle buckets. Only full ones go, so reconnecting never restores a user's tokens."""
+        now = time.monotonic()
+        if now - self._pruned_at < self.prune_interval:
+            return
+        self._pruned_at = now
+        for key in [k for k, bucket in self._buckets.items() if bucket.is_full(now)]:
+            del self._buckets[key]
+            self.stats['pruned'] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'policy': self.policy,
+                'limits': {event: {'rate': rate, 'burst': burst} for event, (rate, burst) in self.limits.items()},
+                'buckets': len(self._buckets),
+                'totals': dict(self.stats),
+                'events': {event: dict(counts) for event, counts in self.stats_by_event.items()},
+            }
+
+# Slow consumer policies
+SLOW_DROP_OLDEST = "drop_oldest"  # degrade: discard the oldest queued event, low-value ones first
+SLOW_DISCONNECT = "disconnect"    # kick the client, it can reconnect and resync
+
+# Events a client can miss without losing state; dropped before anything else.
+# Dropping any other event (a chat message) tells the client to resync instead.
+LOW_VALUE_EVENTS = frozenset({
+    'typing:start', 'typing:stop', 'user:online', 'user:offline', 'channel:subscribers',
+})
+RESYNC_EVENT = 'sync:required'
+
+class OutboundQueues:
+    """Bounded per-socket send queues drained by a single background thread.
+
+    Events are handed to Socket.IO only while the transport backlog of the
+    socket (reported by backlog_fn) is below high_water, so a slow receiver
+    accumulates at most max_queue events here instead of an unbounded buffer.
+    Room broadcasts are emitted once to every socket that keeps up and queued
+    only for the ones that fall behind.
+    """
+
+    def __init__(self, emit_fn: Callable, backlog_fn: Callable[[str], int],
+                 disconnect_fn: Callable[[str], None],
+                 participants_fn: Optional[Callable[[Optional[str]], Iterable[str]]] = None,
+                 max_queue: int = 256, high_water: int = 64, policy: str = SLOW_DROP_OLDEST,
+                 interval: float = 0.01):
+        if policy not in (SLOW_DROP_OLDEST, SLOW_DISCONNECT):
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.emit_fn = emit_fn
+        self.backlog_fn = backlog_fn
+        self.disconnect_fn = disconnect_fn
+        self.participants_fn = participants_fn
+        self.max_queue = max_queue
+        self.high_water = high_water
+        self.policy = policy
+        self.interval = interval
+        self._queues: Dict[str, deque] = {}
+        self._resync: Dict[str, int] = {}  # sid -> chat events dropped since the last notice
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stats = {'enqueued': 0, 'sent': 0, 'dropped': 0, 'dropped_low_value': 0,
+                      'resyncs': 0, 'disconnected': 0, 'deferred': 0, 'broadcasts': 0}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='outbound-queues', daemon=True)
+            self._thread.start()
+
+    def _drop_one(self, sid: str, queue: deque):
+        for i, (event, _) in enumerate(queue):
+            if event in LOW_VALUE_EVENTS:
+                del queue[i]
+                self.stats['dropped_low_value'] += 1
+                return
+        queue.popleft()
+        self.stats['dropped'] += 1
+        self._resync[sid] = self._resync.get(sid, 0) + 1
+
+    def send(self, sid: str, event: str, data) -> bool:
+        """Queue an event for one socket. Returns False if it was dropped."""
+        kick = False
+        with self._cond:
+            queue = self._queues.setdefault(sid, deque())
+            if len(queue) >= self.max_queue:
+                if self.policy == SLOW_DISCONNECT:
+                    self._queues.pop(sid, None)
+                    self._resync.pop(sid, None)
+                    self.stats['disconnected'] += 1
+                    kick = True
+                elif event in LOW_VALUE_EVENTS:
+                    # Not worth displacing anything already queued
+                    self.stats['dropped_low_value'] += 1
+                    return False
+                else:
+                    self._drop_one(sid, queue)
+            if not kick:
+                queue.append((event, data))
+                self.stats['enqueued'] += 1
+                self._cond.notify()
+        if kick:
+            self.disconnect_fn(sid)
+            return False
+        return True
+
+    def broadcast(self, event: str, data, room: Optional[str] = None):
+        """Emit to a room (everyone when room is None) with the same backlog limits as send()."""
+        with self._cond:
+            slow = [sid for sid in self.participants_fn(room)
+                    if sid in self._queues or self.backlog_fn(sid) >= self.high_water]
+            self.stats['broadcasts'] += 1
+        # One encode for everyone keeping up; slow sockets get it through their queue, in order
+        self.emit_fn(event, data, to=room, skip_sid=slow or None)
+        for sid in slow:
+            self.send(sid, event, data)
+
+    def discard(self, sid: str):
+        with self._cond:
+            self._queues.pop(sid, None)
+            self._resync.pop(sid, None)
+
+    def flush_once(self) -> bool:
+        """Hand queued events to Socket.IO. Returns True if anything is still pending."""
+        with self._cond:
+            ready = []
+            pending = False
+            for sid, queue in self._queues.items():
+                if not queue and sid not in self._resync:
+                    continue
+                room = self.high_water - self.backlog_fn(sid)
+                if room <= 0:
+                    self.stats['deferred'] += 1
+                    pending = True
+                    continue
+                while queue and room > 0:
+                    ready.append((sid,) + queue.popleft())
+                    room -= 1
+                if not queue and room > 0 and sid in self._resync:
+                    # Caught up: ask the client to reload what it missed
+                    ready.append((sid, RESYNC_EVENT, {'dropped': self._resync.pop(sid)}))
+                    self.stats['resyncs'] += 1
+                pending = pending or bool(queue) or sid in self._resync
+            for sid in [sid for sid, queue in self._queues.items() if not queue and sid not in self._resync]:
+                del self._queues[sid]
+
+        for sid, event, data in ready:
+            self.emit_fn(event, data, to=sid)
+        with self._cond:
+            self.stats['sent'] += len(ready)
+        return pending
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queues:
+                    self._cond.wait()
+            if self.flush_once():
+                time.sleep(self.interval)
+
+    def get_stats(self) -> dict:
+        with self._cond:
+            return {
+                'policy': self.policy,
+                'max_queue': self.max_queue,
+                'high_water': self.high_water,
+                'queued_sockets': len(self._queues),
+                'queued_events': sum(len(q) for q in self._queues.values()),
+                'totals': dict(self.stats),
+            }
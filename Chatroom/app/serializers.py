@@ -0,0 +1,34 @@
+from typing import Optional
+
+from .models import Attachment
+
+# JSON shapes shared by the REST routes, socket events and exports, so a
+# message looks the same however the client received it.
+
+def serialize_attachment(attachment: Optional[Attachment]) -> Optional[dict]:
+    if not attachment:
+        return None
+    return {
+        'id': attachment.id,
+        'filename': attachment.filename,
+        'mime_type': attachment.mime_type,
+        'size': attachment.blob.size,
+        'url': f'/api/attachments/{attachment.id}',
+        'thumbnail_url': f'/api/attachments/{attachment.id}/thumbnail' if attachment.blob.thumbnail_path else None
+    }
+
+def serialize_message(message, sender: Optional[dict], attachment: Optional[Attachment] = None,
+                      content: Optional[str] = None) -> dict:
+    """`message` is a Message or a row with the same columns (archive rows store the content
+    type by name and their content compressed, so the caller passes it decoded)."""
+    content_type = message.content_type
+    return {
+        'id': message.id,
+        'conversation_id': message.conversation_id,
+        'sender_id': message.sender_id,
+        'content': message.content if content is None else content,
+        'content_type': getattr(content_type, 'value', content_type),
+        'attachment': serialize_attachment(attachment),
+        'created_at': message.created_at.isoformat() if message.created_at else None,
+        'sender': sender
+    }
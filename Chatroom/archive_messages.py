@@ -0,0 +1,39 @@
+"""將超過保留期限的訊息搬移到每月封存表
+
+用法:
+    python archive_messages.py --days 180
+    python archive_messages.py --days 30 --dry-run
+"""
+import argparse
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.database import SessionLocal, engine, Base
+from app.archive import archive_messages, retention_cutoff
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive old chat messages')
+    parser.add_argument('--days', type=int, default=int(os.getenv('MESSAGE_RETENTION_DAYS', '180')),
+                        help='keep messages newer than this many days in the hot table')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--dry-run', action='store_true', help='only count the messages that would move')
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    cutoff = retention_cutoff(args.days)
+
+    db = SessionLocal()
+    try:
+        stats = archive_messages(db, cutoff, batch_size=args.batch_size, dry_run=args.dry_run)
+    finally:
+        db.close()
+
+    action = 'Would archive' if args.dry_run else 'Archived'
+    print(f'{action} {stats["archived"]} messages older than {cutoff.isoformat()}')
+    for name, count in sorted(stats['segments'].items()):
+        print(f'  {name}: {count}')
+
+if __name__ == '__main__':
+    main()
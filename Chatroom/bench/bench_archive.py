@@ -0,0 +1,98 @@
+"""封存壓縮 benchmark：比較封存前後的資料庫大小與分頁讀取延遲
+
+用法（在 Chatroom/ 目錄下）:
+    python bench/bench_archive.py --messages 200000 --months 12
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--messages', type=int, default=100000)
+parser.add_argument('--months', type=int, default=12)
+parser.add_argument('--conversations', type=int, default=50)
+parser.add_argument('--retention-days', type=int, default=30)
+args = parser.parse_args()
+
+db_path = os.path.join(tempfile.mkdtemp(), 'bench_archive.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, text
+from app.database import SessionLocal, engine, Base
+from app.models import User, Conversation, ConversationParticipant, Message
+from app.archive import archive_messages, retention_cutoff
+from app.dal import list_messages
+
+def db_size():
+    return os.path.getsize(db_path)
+
+def time_pages(db, conversation_ids, pages=5, limit=50):
+    samples = []
+    for conv_id in conversation_ids:
+        before_id = None
+        for _ in range(pages):
+            start = time.perf_counter()
+            page = list_messages(db, conv_id, limit=limit, before_id=before_id)
+            samples.append(time.perf_counter() - start)
+            if not page:
+                break
+            before_id = page[-1].id
+    samples.sort()
+    return samples[len(samples) // 2] * 1000, samples[int(len(samples) * 0.95)] * 1000
+
+Base.metadata.create_all(bind=engine)
+db = SessionLocal()
+
+users = [User(display_name=f'user{i}', email=f'user{i}@bench.local') for i in range(20)]
+db.add_all(users)
+for i in range(args.conversations):
+    conv = Conversation(type='direct')
+    db.add(conv)
+    db.flush()
+    db.add(ConversationParticipant(conversation_id=conv.id, user_id=users[i % 20].id))
+    db.add(ConversationParticipant(conversation_id=conv.id, user_id=users[(i + 1) % 20].id))
+db.commit()
+
+start_date = datetime.utcnow() - timedelta(days=30 * args.months)
+step = timedelta(days=30 * args.months) / args.messages
+rows = [{
+    'conversation_id': random.randint(1, args.conversations),
+    'sender_id': random.randint(1, 20),
+    'content': 'lorem ipsum dolor sit amet ' * random.randint(1, 6),
+    'created_at': start_date + step * i,
+} for i in range(args.messages)]
+for i in range(0, len(rows), 10000):
+    db.execute(insert(Message), rows[i:i + 10000])
+db.commit()
+db.execute(text('VACUUM'))
+
+conv_ids = list(range(1, min(args.conversations, 20) + 1))
+size_before = db_size()
+p50_before, p95_before = time_pages(db, conv_ids)
+
+start = time.perf_counter()
+stats = archive_messages(db, retention_cutoff(args.retention_days), batch_size=5000)
+elapsed = time.perf_counter() - start
+db.execute(text('VACUUM'))
+db.close()
+
+db = SessionLocal()
+size_after = db_size()
+p50_hot, p95_hot = time_pages(db, conv_ids, pages=1)
+p50_after, p95_after = time_pages(db, conv_ids)
+hot_left = db.query(Message).count()
+db.close()
+
+print(f'messages:        {args.messages} over {args.months} months, {args.conversations} conversations')
+print(f'archived:        {stats["archived"]} into {len(stats["segments"])} segments in {elapsed:.2f}s '
+      f'({stats["archived"] / elapsed:.0f} msg/s), {hot_left} left hot')
+print(f'db size:         {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB '
+      f'({100 * (1 - size_after / size_before):.0f}% smaller)')
+print(f'page latency:    before p50 {p50_before:.2f} ms / p95 {p95_before:.2f} ms')
+print(f'                 after  p50 {p50_after:.2f} ms / p95 {p95_after:.2f} ms (5 pages, spills into archive)')
+print(f'                 hot-only first page p50 {p50_hot:.2f} ms / p95 {p95_hot:.2f} ms')
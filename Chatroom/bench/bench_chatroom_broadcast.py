@@ -0,0 +1,108 @@
+"""聊天室廣播 benchmark：比較逐則廣播與 tick 批次廣播的延遲 / 吞吐量取捨
+
+以 Flask-SocketIO test client 模擬 N 個在線用戶，依固定速率送出聊天室訊息，
+統計每位用戶收到的 frame 數、伺服器花在 emit 的時間與每則訊息的投遞延遲。
+
+用法（在 Chatroom/ 目錄下）:
+    python bench/bench_chatroom_broadcast.py --clients 200 --messages 500 --rate 500 --ticks 10 25 50
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--clients', type=int, default=200)
+parser.add_argument('--messages', type=int, default=500)
+parser.add_argument('--rate', type=float, default=500, help='messages per second sent into the room')
+parser.add_argument('--ticks', type=float, nargs='+', default=[10, 25, 50], help='tick lengths in ms')
+parser.add_argument('--max-batch', type=int, default=100)
+args = parser.parse_args()
+
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tempfile.mkdtemp(), "bench_broadcast.db")}'
+os.environ['AUTH_MODE'] = 'mock'
+os.environ['CHATROOM_BATCH_MODE'] = '0'
+os.environ['RATE_LIMIT_CHATROOM_SEND'] = '1000000,1000000'
+os.environ['LOG_LEVELS'] = 'chatroom=WARNING,chatroom.messages=WARNING'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import main
+logging.disable(logging.CRITICAL)
+
+from app.broadcast import TickBatcher
+
+original_emit = main.socketio.emit
+sent_at = {}
+delivered_at = {}
+emit_time = [0.0]
+lock = threading.Lock()
+
+def timed_emit(event, data=None, *a, **kw):
+    start = time.perf_counter()
+    original_emit(event, data, *a, **kw)
+    done = time.perf_counter()
+    if event in ('chatroom:message', 'chatroom:batch'):
+        messages = data['messages'] if event == 'chatroom:batch' else [data]
+        with lock:
+            emit_time[0] += done - start
+            for message in messages:
+                delivered_at[message['content']] = done
+
+main.socketio.emit = timed_emit
+
+def connect(name):
+    http = main.app.test_client()
+    http.post('/auth/dev-login', json={'display_name': name})
+    sock = main.socketio.test_client(main.app, flask_test_client=http)
+    sock.emit('authenticate', {})
+    sock.get_received()
+    return sock
+
+with contextlib.redirect_stdout(io.StringIO()):
+    clients = [connect(f'listener{i}') for i in range(args.clients)]
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+def run(label, batcher):
+    main.chatroom_batcher = batcher
+    sent_at.clear()
+    delivered_at.clear()
+    emit_time[0] = 0.0
+    for sock in clients:
+        sock.get_received()
+
+    interval = 1.0 / args.rate
+    start = time.perf_counter()
+    for i in range(args.messages):
+        content = f'{label} message {i}'
+        target = start + i * interval
+        delay = target - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        sent_at[content] = time.perf_counter()
+        clients[i % len(clients)].emit('chatroom:send', {'content': content})
+
+    while len(delivered_at) < args.messages:
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - start
+
+    frames = sum(len(sock.get_received()) for sock in clients) / len(clients)
+    latencies = [delivered_at[c] - t for c, t in sent_at.items()]
+    print(f'{label:<12} | {args.messages / elapsed:7.0f} msg/s | {frames:6.0f} frames/client | '
+          f'emit {emit_time[0] * 1000:8.1f} ms total | latency p50 {percentile(latencies, 0.5):6.2f} ms '
+          f'p95 {percentile(latencies, 0.95):6.2f} ms')
+
+print(f'{args.clients} clients, {args.messages} messages at {args.rate:.0f} msg/s')
+run('immediate', None)
+for tick in args.ticks:
+    batcher = TickBatcher(timed_emit, tick=tick / 1000, max_batch=args.max_batch)
+    batcher.start()
+    run(f'tick {tick:g} ms', batcher)
@@ -0,0 +1,100 @@
+"""群組訊息 fan-out benchmark：量測 10 / 100 / 1000 人群組的投遞延遲
+
+每則訊息經由 group:send 儲存一次並對會話 room 廣播一次，
+與逐一對每位成員 emit 的作法比較。使用 Flask-SocketIO 的 test client，
+量到的是伺服器端（儲存 + 編碼 + 投遞到所有 socket）的時間。
+
+用法（在 Chatroom/ 目錄下）:
+    python bench/bench_group_fanout.py --sizes 10 100 1000 --messages 50
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+parser.add_argument('--messages', type=int, default=50)
+args = parser.parse_args()
+
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tempfile.mkdtemp(), "bench_group.db")}'
+os.environ['AUTH_MODE'] = 'mock'
+os.environ['RATE_LIMIT_GROUP_SEND'] = '1000000,1000000'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import main
+logging.disable(logging.CRITICAL)
+
+from sqlalchemy import insert
+from app.dal import save_message
+from app.models import Friendship
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+def connect(name):
+    http = main.app.test_client()
+    user_id = http.post('/auth/dev-login', json={'display_name': name}).json['user']['id']
+    sock = main.socketio.test_client(main.app, flask_test_client=http)
+    sock.emit('authenticate', {})
+    return user_id, http, sock
+
+def run(size):
+    with contextlib.redirect_stdout(io.StringIO()):
+        owner_id, owner_http, owner_sock = connect(f'owner{size}')
+        members = [connect(f'member{size}_{i}') for i in range(size - 1)]
+
+        db = main.get_db()
+        db.execute(insert(Friendship), [
+            {'user_id_a': owner_id, 'user_id_b': member_id} for member_id, _, _ in members
+        ])
+        db.commit()
+        db.close()
+
+        conv = owner_http.post('/api/conversations/groups', json={
+            'name': f'bench {size}',
+            'member_ids': [member_id for member_id, _, _ in members]
+        }).json['conversation']
+        for _, _, sock in members:
+            sock.get_received()
+        owner_sock.get_received()
+
+        room_samples = []
+        for i in range(args.messages):
+            start = time.perf_counter()
+            owner_sock.emit('group:send', {'conversation_id': conv['id'], 'content': f'hello {i}'})
+            room_samples.append(time.perf_counter() - start)
+
+        delivered = sum(len(sock.get_received()) for _, _, sock in members)
+
+        # 對照組：儲存後對每位成員各 emit 一次（舊的 online_users[recipient_id] 作法）
+        sids = [main.online_users[member_id] for member_id, _, _ in members]
+        loop_samples = []
+        db = main.get_db()
+        for i in range(args.messages):
+            start = time.perf_counter()
+            message = save_message(db, conv['id'], owner_id, f'hello {i}')
+            payload = {'id': message.id, 'conversation_id': conv['id'], 'content': message.content}
+            for sid in sids:
+                main.socketio.emit('message:new', payload, to=sid)
+            loop_samples.append(time.perf_counter() - start)
+        db.close()
+
+        for _, _, sock in members:
+            sock.disconnect()
+        owner_sock.disconnect()
+
+    expected = args.messages * (size - 1)
+    print(f'{size:>5} members | room emit p50 {percentile(room_samples, 0.5):8.2f} ms  '
+          f'p95 {percentile(room_samples, 0.95):8.2f} ms | per-member emit p50 '
+          f'{percentile(loop_samples, 0.5):8.2f} ms  p95 {percentile(loop_samples, 0.95):8.2f} ms | '
+          f'delivered {delivered}/{expected}')
+
+for size in args.sizes:
+    run(size)
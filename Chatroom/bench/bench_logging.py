@@ -0,0 +1,97 @@
+"""日誌開銷 benchmark：比較 print() 與 queue-based 結構化日誌的每則訊息成本
+
+stdout 接到一個 pipe，另一端由執行緒讀取（模擬 electron-main.js 讀 Flask stdout），
+量測的是 socket handler 端每則訊息付出的時間。
+
+用法（在 Chatroom/ 目錄下）:
+    python bench/bench_logging.py --messages 20000
+"""
+import argparse
+import atexit
+import importlib
+import io
+import logging
+import os
+import sys
+import threading
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--messages', type=int, default=20000)
+parser.add_argument('--content-size', type=int, default=200)
+parser.add_argument('--reader-delay', type=float, default=0.2,
+                    help='ms the pipe reader spends per 4 KB read (0 = reader always keeps up)')
+args = parser.parse_args()
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app.logging_config as logging_config
+
+content = 'x' * args.content_size
+
+def open_pipe(line_buffered):
+    read_fd, write_fd = os.pipe()
+
+    def drain():
+        with os.fdopen(read_fd, 'rb') as reader:
+            while reader.read(4096):
+                if args.reader_delay:
+                    time.sleep(args.reader_delay / 1000)
+
+    thread = threading.Thread(target=drain, daemon=True)
+    thread.start()
+    stream = io.open(write_fd, 'w', buffering=1 if line_buffered else -1, encoding='utf-8')
+    return stream, thread
+
+def bench_print(line_buffered):
+    stream, thread = open_pipe(line_buffered)
+    start = time.perf_counter()
+    for i in range(args.messages):
+        print(f'Chatroom message: user{i % 50}: {content}', file=stream)
+    elapsed = time.perf_counter() - start
+    stream.close()
+    thread.join()
+    return elapsed
+
+def bench_logging(env):
+    global logging_config
+    for key in ('LOG_REDACT_CONTENT', 'LOG_SAMPLE_MESSAGES'):
+        os.environ.pop(key, None)
+    os.environ.update(env)
+
+    # Fresh logging state for every run
+    logging.shutdown()
+    for name in ('', 'chatroom.messages'):
+        logger = logging.getLogger(name)
+        logger.handlers = []
+        logger.filters = []
+    logging_config = importlib.reload(logging_config)
+
+    stream, thread = open_pipe(line_buffered=True)
+    listener = logging_config.configure_logging(stream)
+    logger = logging.getLogger('chatroom.messages')
+
+    start = time.perf_counter()
+    for i in range(args.messages):
+        logger.info('Chatroom message', extra={'sender_id': i % 50, 'content': content})
+    elapsed = time.perf_counter() - start
+
+    listener.stop()
+    atexit.unregister(listener.stop)
+    stream.close()
+    thread.join()
+    return elapsed
+
+results = [
+    ('print, block-buffered pipe', bench_print(line_buffered=False)),
+    ('print, line-buffered pipe', bench_print(line_buffered=True)),
+    ('queue logging', bench_logging({})),
+    ('queue logging + redaction', bench_logging({'LOG_REDACT_CONTENT': '1'})),
+    ('queue logging + 1% sampling', bench_logging({'LOG_SAMPLE_MESSAGES': '0.01'})),
+]
+
+baseline = results[1][1] / args.messages * 1e6
+print(f'{args.messages} messages, {args.content_size}-byte content, reader delay {args.reader_delay} ms/4 KB, '
+      f'caller-side cost per message:')
+for name, elapsed in results:
+    per_message = elapsed / args.messages * 1e6
+    print(f'  {name:<30} {per_message:8.2f} us  (saves {baseline - per_message:+.2f} us vs line-buffered print)')
@@ -0,0 +1,147 @@
+"""開啟視窗 benchmark：比較壓縮 + 快取外殼前後的傳輸量與延遲
+
+模擬瀏覽器開啟聊天視窗時的請求序列：
+    GET /、靜態 CSS / JS、GET /api/bootstrap、GET 一頁訊息歷史
+
+before: 舊作法，CSS / JS 內嵌在每次重新 render 的 index.html，回應不壓縮
+after:  外殼快取並預先壓縮、靜態檔帶版本號（immutable）、JSON 超過門檻才壓縮
+回訪時 after 的外殼以 ETag 驗證（304），靜態檔直接由瀏覽器快取提供。
+
+延遲 = 伺服器處理時間（test client，中位數）+ 以 --mbps 頻寬估算的傳輸時間。
+
+用法（在 Chatroom/ 目錄下）:
+    python bench/bench_window_open.py --messages 200 --mbps 10 --iterations 50
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--messages', type=int, default=200, help='messages in the history page')
+parser.add_argument('--friends', type=int, default=20)
+parser.add_argument('--mbps', type=float, default=10.0, help='simulated link bandwidth')
+parser.add_argument('--iterations', type=int, default=50)
+args = parser.parse_args()
+
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tempfile.mkdtemp(), "bench_window.db")}'
+os.environ['AUTH_MODE'] = 'mock'
+os.environ['LOG_LEVELS'] = 'chatroom=WARNING'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import main
+logging.disable(logging.CRITICAL)
+
+from flask import render_template
+from sqlalchemy import insert
+from app.dal import create_user, create_group_conversation
+from app.models import Friendship, Message
+
+client = main.app.test_client()
+client.post('/auth/dev-login', json={'display_name': 'bench'})
+
+db = main.SessionLocal()
+me = main.get_user_by_email(db, 'bench@mock.local')
+friends = [create_user(db, display_name=f'friend{i}', email=f'friend{i}@bench.local') for i in range(args.friends)]
+db.execute(insert(Friendship), [{'user_id_a': me.id, 'user_id_b': f.id} for f in friends])
+conversation = create_group_conversation(db, me.id, 'bench', [f.id for f in friends])
+conversation_id = conversation.id
+# 隨機字詞組成的訊息，避免重複內容讓壓縮率看起來過好
+rng = random.Random(0)
+vocabulary = [''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(2, 9))) for _ in range(2000)]
+db.execute(insert(Message), [{
+    'conversation_id': conversation_id,
+    'sender_id': rng.choice(friends).id,
+    'content': ' '.join(rng.choices(vocabulary, k=rng.randint(3, 25)))
+} for _ in range(args.messages)])
+db.commit()
+db.close()
+
+api_paths = ['/api/bootstrap', f'/api/conversations/{conversation_id}/messages?limit={args.messages}']
+
+# 重建舊的外殼：CSS / JS 內嵌在頁面中，每次請求重新 render
+with main.app.test_request_context():
+    shell = render_template('index.html')
+static_paths = re.findall(r'(?:href|src)="(/static/[^"]+)"', shell)
+
+def inline_source():
+    source = open(os.path.join(main.app.template_folder, 'index.html'), encoding='utf-8').read()
+    css = open(os.path.join(main.app.static_folder, 'css/chat.css'), encoding='utf-8').read()
+    js = open(os.path.join(main.app.static_folder, 'js/chat.js'), encoding='utf-8').read()
+    source = re.sub(r'<link rel="stylesheet"[^>]*>', lambda m: f'<style>\n{css}</style>', source)
+    return re.sub(r'<script src="\{\{[^"]*\}\}"></script>', lambda m: f'<script>\n{js}</script>', source)
+
+inline_template = main.app.jinja_env.from_string(inline_source())
+cached_index = main.app.view_functions['index']
+
+def old_index():
+    return render_template(inline_template)
+
+def fetch(path, headers):
+    start = time.perf_counter()
+    response = client.get(path, headers=headers)
+    elapsed = time.perf_counter() - start
+    assert response.status_code in (200, 304), (path, response.status_code)
+    return response, elapsed
+
+def visit(mode, accept_encoding, repeat):
+    """一次開啟視窗；回傳 {path: (bytes, seconds)}"""
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    results = {}
+    if mode == 'before':
+        paths = ['/'] + api_paths
+    else:
+        # 回訪時靜態檔由瀏覽器快取（immutable）提供，不發請求
+        paths = ['/'] + ([] if repeat else static_paths) + api_paths
+    for path in paths:
+        request_headers = dict(headers)
+        if mode == 'after' and repeat and path == '/':
+            request_headers['If-None-Match'] = etags['/']
+        response, elapsed = fetch(path, request_headers)
+        if path == '/':
+            etags['/'] = response.headers.get('ETag')
+        results[path] = (len(response.data), elapsed)
+    return results
+
+etags = {}
+
+def run(label, mode, accept_encoding, repeat=False):
+    main.app.view_functions['index'] = old_index if mode == 'before' else cached_index
+    visit(mode, accept_encoding, False)  # warm up (first render, template compile)
+    samples = [visit(mode, accept_encoding, repeat) for _ in range(args.iterations)]
+
+    total_bytes = sum(size for size, _ in samples[0].values())
+    server_ms = statistics.median(sum(t for _, t in s.values()) for s in samples) * 1000
+    transfer_ms = total_bytes * 8 / (args.mbps * 1e6) * 1000
+    print(f'{label:<26} | {len(samples[0]):2d} req | {total_bytes:8d} B | server {server_ms:7.2f} ms | '
+          f'transfer {transfer_ms:7.2f} ms | total {server_ms + transfer_ms:7.2f} ms')
+    for path, (size, _) in samples[0].items():
+        per_request = statistics.median(s[path][1] for s in samples) * 1000
+        print(f'    {path[:56]:<56} {size:8d} B {per_request:7.2f} ms')
+    return total_bytes, server_ms + transfer_ms
+
+print(f'{args.messages} messages, {args.friends} friends, {args.mbps:g} Mbit/s, '
+      f'encodings: {", ".join(main.compressor.get_stats()["encodings"])}')
+print()
+before = run('before (first visit)', 'before', None)
+before_repeat = run('before (repeat visit)', 'before', None, repeat=True)
+after_gzip = run('after gzip (first visit)', 'after', 'gzip, deflate')
+after = run('after br (first visit)', 'after', 'gzip, deflate, br')
+after_repeat = run('after br (repeat visit)', 'after', 'gzip, deflate, br', repeat=True)
+
+print()
+for label, (b_bytes, b_ms), (a_bytes, a_ms) in (
+    ('first visit, gzip', before, after_gzip),
+    ('first visit, br', before, after),
+    ('repeat visit, br', before_repeat, after_repeat),
+):
+    print(f'{label:<18} saved {b_bytes - a_bytes:8d} B ({(1 - a_bytes / b_bytes) * 100:5.1f}%), '
+          f'{b_ms - a_ms:7.2f} ms ({(1 - a_ms / b_ms) * 100:5.1f}%)')
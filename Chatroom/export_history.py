@@ -0,0 +1,45 @@
+"""將會話歷史匯出為 NDJSON（可選 gzip 壓縮）
+
+用法:
+    python export_history.py --conversation 12 -o conversation-12.ndjson
+    python export_history.py --user 3 --gzip -o user-3.ndjson.gz
+"""
+import argparse
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.database import SessionLocal
+from app.export import iter_conversation_messages, iter_user_messages, iter_ndjson, iter_gzip
+
+def main():
+    parser = argparse.ArgumentParser(description='Export chat history as NDJSON')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--conversation', type=int, help='export one conversation')
+    target.add_argument('--user', type=int, help="export every conversation of a user")
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    parser.add_argument('--gzip', action='store_true', help='gzip the output')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='rows fetched per DB round trip')
+    args = parser.parse_args()
+
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    db = SessionLocal()
+    try:
+        if args.conversation is not None:
+            records = iter_conversation_messages(db, args.conversation, args.chunk_size)
+        else:
+            records = iter_user_messages(db, args.user, args.chunk_size)
+
+        chunks = iter_ndjson(records)
+        if args.gzip:
+            chunks = iter_gzip(chunks)
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        db.close()
+        if args.output:
+            out.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,9 @@
-﻿from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+﻿from flask import Flask, Response, abort, g, render_template, request, jsonify, session, redirect, url_for, send_file
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from dotenv import load_dotenv
 import os
 import time
+import logging
 from datetime import datetime, timezone
 from functools import wraps
 from authlib.integrations.flask_client import OAuth
@@ -10,19 +11,67 @@ from authlib.integrations.flask_client import OAuth
 # 載入環境變數
 load_dotenv()
 
+# 結構化日誌：透過背景 queue handler 輸出，避免阻塞 socket handler
+from app.logging_config import configure_logging
+configure_logging()
+logger = logging.getLogger('chatroom')
+socket_logger = logging.getLogger('chatroom.socket')
+message_logger = logging.getLogger('chatroom.messages')
+
 # 導入資料庫相關模組
-from app.database import SessionLocal, engine, Base
+from app.database import SessionLocal, engine, Base, POOL_SIZE, MAX_OVERFLOW, add_missing_columns, ensure_sqlite_autoincrement
+from app.models import Message, ContentType, AttachmentConversation
+from sqlalchemy import inspect
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from app.dal import (
     create_user, get_user_by_id, get_user_by_email,
     create_friend_request, respond_friend_request, get_friend_requests,
     are_friends, get_friends,
     get_or_create_direct_conversation, save_message, list_messages,
-    mark_read, get_unread_count, get_conversations
+    mark_read, get_unread_count, get_conversations,
+    create_group_conversation, get_conversation,
+    get_user_conversation_ids, add_participants, remove_participant,
+    get_friend_requests_with_users, get_conversation_summaries, is_participant,
+    get_or_create_channel, get_channel_by_name, count_channels_created_by,
+    list_channels, save_channel_message, list_channel_messages,
+    get_attachment, get_upload, can_access_attachment
+)
+from app.channels import ChannelRegistry, channel_room, is_valid_channel_name
+from app.membership import membership_cache
+from app.admission import (
+    AdmissionController, Overloaded, PRIORITY_LOW, PRIORITY_NORMAL, PRIORITY_HIGH
 )
+from app.broadcast import TickBatcher
+from app.maintenance import MaintenanceScheduler, default_jobs, recent_runs
+from app.archive import archive_table_names, archived_high_water_mark, get_archive_table, backfill_attachment_links
+from app.attachments import AttachmentStore, UploadError, attachment_root, is_inline_image
+from app.avatars import AvatarCache, avatar_version
+from app.compression import ResponseCompressor, ShellCache, StaticAssets
+from app.export import iter_conversation_messages, iter_user_messages, iter_ndjson, iter_gzip
+from app.serializers import serialize_attachment, serialize_message
+from app.profiler import HandlerProfiler, sample_stacks, format_collapsed
+from app.ratelimit import RateLimiter, OutboundQueues, load_limits_from_env
 
 # 初始化資料庫表
+had_attachment_links = inspect(engine).has_table(AttachmentConversation.__tablename__)
 Base.metadata.create_all(bind=engine)
 
+def upgrade_schema():
+    """為既有的 messages 與封存表補上新增的欄位，並確保訊息 id 不會被重複使用"""
+    add_missing_columns(Message.__table__)
+    with SessionLocal() as db:
+        names = archive_table_names(db)
+        archived_max_id = archived_high_water_mark(db)
+    ensure_sqlite_autoincrement(Message.__table__, archived_max_id)
+    for name in names:
+        add_missing_columns(get_archive_table(name))
+    if not had_attachment_links:
+        # 新建的附件與會話對照表：由既有訊息（含封存）補齊
+        with SessionLocal() as db:
+            backfill_attachment_links(db)
+
+upgrade_schema()
+
 base_dir = os.path.dirname(os.path.abspath(__file__))
 app = Flask(
     __name__,
@@ -32,6 +81,8 @@ app = Flask(
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+# 前面有 nginx 等反向代理時可交給它以 sendfile 傳送附件
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', '0') == '1'
 
 # === [新增] Google OAuth 設定 ===
 app.config['GOOGLE_CLIENT_ID'] = os.getenv('GOOGLE_CLIENT_ID')
@@ -57,24 +108,185 @@ socketio = SocketIO(
     app,
     cors_allowed_origins=os.getenv('SOCKETIO_CORS_ORIGINS', '*'),
     async_mode='threading',
-    logger=True,
-    engineio_logger=True
+    logger=logging.getLogger('socketio'),
+    engineio_logger=logging.getLogger('engineio')
 )
 
 # Debug info: help diagnose TemplateNotFound issues
-print('DEBUG: base_dir =', base_dir)
-print('DEBUG: app.template_folder =', app.template_folder)
-try:
-    print('DEBUG: templates exist =', os.path.isdir(app.template_folder))
-    if os.path.isdir(app.template_folder):
-        print('DEBUG: templates listing =', os.listdir(app.template_folder))
-except Exception as _e:
-    print('DEBUG: error inspecting templates folder:', _e)
+logger.debug('Template folder', extra={
+    'base_dir': base_dir,
+    'template_folder': app.template_folder,
+    'exists': os.path.isdir(app.template_folder)
+})
 
 # 在線用戶追蹤（保留在記憶體）
 online_users = {}  # {user_id: socket_id}
 user_sockets = {}  # {socket_id: user_id}
 
+# 每位用戶、每種事件的 token bucket 限流
+rate_limiter = RateLimiter(
+    load_limits_from_env(),
+    policy=os.getenv('RATE_LIMIT_POLICY', 'error'),
+    max_delay=float(os.getenv('RATE_LIMIT_MAX_DELAY', '1.0')),
+    prune_interval=float(os.getenv('RATE_LIMIT_PRUNE_SECONDS', '60'))
+)
+
+def _socket_backlog(socket_id):
+    """尚未送出給該 socket 的 Engine.IO 封包數量"""
+    eio_sid = socketio.server.manager.eio_sid_from_sid(socket_id, '/')
+    eio_socket = socketio.server.eio.sockets.get(eio_sid) if eio_sid else None
+    return eio_socket.queue.qsize() if eio_socket else 0
+
+# 每個 socket 的有界發送佇列（處理慢速接收端）；room 廣播也經過這裡，落後的 socket 改走佇列
+outbound = OutboundQueues(
+    emit_fn=socketio.emit,
+    backlog_fn=_socket_backlog,
+    disconnect_fn=lambda socket_id: socketio.server.disconnect(socket_id, namespace='/'),
+    participants_fn=lambda room: [sid for sid, _ in socketio.server.manager.get_participants('/', room)],
+    max_queue=int(os.getenv('SEND_QUEUE_MAX', '256')),
+    high_water=int(os.getenv('SEND_QUEUE_HIGH_WATER', '64')),
+    policy=os.getenv('SLOW_CONSUMER_POLICY', 'drop_oldest')
+)
+outbound.start()
+
+def conversation_room(conversation_id):
+    """每個會話對應一個 Socket.IO room"""
+    return f'conversation:{conversation_id}'
+
+def sync_room_membership(conversation_id, joined=(), left=()):
+    """成員變更時，只更新受影響的在線 socket 的 room 訂閱"""
+    room = conversation_room(conversation_id)
+    for user_id in joined:
+        if user_id in online_users:
+            join_room(room, sid=online_users[user_id], namespace='/')
+    for user_id in left:
+        if user_id in online_users:
+            leave_room(room, sid=online_users[user_id], namespace='/')
+
+# DB 連線池壓力過高時，依優先序快速拒絕請求
+admission = AdmissionController(
+    capacity_fn=lambda: POOL_SIZE + MAX_OVERFLOW,
+    checked_out_fn=lambda: engine.pool.checkedout() if hasattr(engine.pool, 'checkedout') else 0,
+    elevated_utilization=float(os.getenv('ADMISSION_ELEVATED_UTILIZATION', '0.7')),
+    critical_utilization=float(os.getenv('ADMISSION_CRITICAL_UTILIZATION', '0.9')),
+    elevated_wait=float(os.getenv('ADMISSION_ELEVATED_WAIT_MS', '100')) / 1000,
+    critical_wait=float(os.getenv('ADMISSION_CRITICAL_WAIT_MS', '500')) / 1000,
+    retry_after=float(os.getenv('ADMISSION_RETRY_AFTER', '1'))
+)
+admission.watch_engine(engine)
+
+# 各 socket 事件的優先序；未列出的為 NORMAL
+SOCKET_EVENT_PRIORITY = {
+    'message:send': PRIORITY_HIGH,
+    'chatroom:send': PRIORITY_HIGH,
+    'group:send': PRIORITY_HIGH,
+    'channel:send': PRIORITY_HIGH,
+    'typing:start': PRIORITY_LOW,
+    'typing:stop': PRIORITY_LOW,
+}
+
+# 資料庫維護排程（也可用 maintenance_worker.py 獨立執行）
+maintenance = MaintenanceScheduler(
+    engine, SessionLocal, default_jobs(),
+    is_idle=lambda: admission.pressure() == 'ok' and admission.in_flight <= int(os.getenv('MAINTENANCE_MAX_IN_FLIGHT', '2')),
+    jitter=float(os.getenv('MAINTENANCE_JITTER', '0.1')),
+    poll_interval=float(os.getenv('MAINTENANCE_POLL_SECONDS', '30'))
+)
+if os.getenv('MAINTENANCE_IN_PROCESS', '0') == '1':
+    maintenance.start()
+
+# 聊天室廣播批次化：每個 tick 只送出一個 chatroom:batch frame
+chatroom_batcher = None
+if os.getenv('CHATROOM_BATCH_MODE', '0') == '1':
+    chatroom_batcher = TickBatcher(
+        outbound.broadcast,
+        tick=float(os.getenv('CHATROOM_TICK_MS', '35')) / 1000,
+        max_batch=int(os.getenv('CHATROOM_MAX_BATCH', '100'))
+    )
+    chatroom_batcher.start()
+
+# 具名頻道：訂閱者與最近訊息緩衝
+channels = ChannelRegistry(recent_size=int(os.getenv('CHANNEL_RECENT_SIZE', '50')))
+CHANNEL_MAX_PER_USER = int(os.getenv('CHANNEL_MAX_PER_USER', '20'))
+
+# 頭像代理：每個來源 URL 只抓一次，縮圖存在以內容雜湊命名的磁碟快取
+avatar_cache = AvatarCache(
+    os.getenv('AVATAR_CACHE_DIR') or os.path.join(base_dir, 'avatar_cache'),
+    size=int(os.getenv('AVATAR_SIZE', '128')),
+    max_bytes=int(os.getenv('AVATAR_CACHE_MAX_MB', '64')) * 1024 * 1024,
+    failure_ttl=float(os.getenv('AVATAR_FAILURE_TTL', '300'))
+)
+
+def avatar_url_for(user):
+    """回傳本地頭像 URL；版本參數隨來源 URL 改變，因此可以永久快取"""
+    if not user or not user.avatar_url:
+        return None
+    return f'/avatars/{user.id}?v={avatar_version(user.avatar_url)}'
+
+# 檔案附件：可續傳的串流上傳，依 SHA-256 去重，縮圖在背景執行緒產生
+attachment_store = AttachmentStore(
+    attachment_root(),
+    SessionLocal,
+    max_size=int(os.getenv('ATTACHMENT_MAX_MB', '100')) * 1024 * 1024,
+    workers=int(os.getenv('ATTACHMENT_THUMBNAIL_WORKERS', '2'))
+)
+
+def resolve_attachment(db, attachment_id, user_id):
+    """回傳 (attachment, content_type)；附件不存在或無權使用時 attachment 為 None"""
+    attachment = get_attachment(db, attachment_id)
+    if not attachment or not can_access_attachment(db, attachment_id, user_id):
+        return None, None
+    if is_inline_image(attachment):
+        return attachment, ContentType.image
+    return attachment, ContentType.file
+
+def serialize_sender(user):
+    if not user:
+        return None
+    return {
+        'id': user.id,
+        'display_name': user.display_name,
+        'avatar_url': avatar_url_for(user)
+    }
+
+# HTTP 壓縮：動態回應超過門檻才壓縮；頁面外殼與靜態檔預先壓縮後留在記憶體
+compressor = ResponseCompressor(
+    min_size=int(os.getenv('COMPRESS_MIN_BYTES', '1024')),
+    gzip_level=int(os.getenv('COMPRESS_GZIP_LEVEL', '6')),
+    brotli_quality=int(os.getenv('COMPRESS_BROTLI_QUALITY', '4'))
+)
+static_assets = StaticAssets(app.static_folder, min_size=compressor.min_size)
+shell_cache = ShellCache(min_size=compressor.min_size)
+
+def static_url(filename):
+    """靜態檔 URL 帶內容雜湊，內容改變時 URL 跟著改變，因此可以永久快取"""
+    return url_for('static', filename=filename, v=static_assets.version(filename))
+
+@app.context_processor
+def inject_static_url():
+    return {'static_url': static_url}
+
+def precompressed_response(body):
+    """依 Accept-Encoding 選擇預先壓縮的版本，ETag 相符時回 304"""
+    data, encoding = body.select(request.headers.get('Accept-Encoding', ''))
+    etag = f'{body.etag}-{encoding}' if encoding else body.etag
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(data, mimetype=body.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.after_request
+def compress_response(response):
+    return compressor.process(response, request.headers.get('Accept-Encoding', ''))
+
+# 個別 socket 事件 / Flask endpoint 的 cProfile（預設關閉，由 admin API 開啟）
+handler_profiler = HandlerProfiler()
+
 def get_db():
     """獲取資料庫 session"""
     db = SessionLocal()
@@ -92,6 +304,23 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def admin_required(f):
+    """僅允許 ADMIN_EMAILS 中的用戶"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return jsonify({'error': 'Unauthorized'}), 401
+        admin_emails = {e.strip().lower() for e in os.getenv('ADMIN_EMAILS', '').split(',') if e.strip()}
+        db = get_db()
+        try:
+            user = get_user_by_id(db, session['user_id'])
+        finally:
+            db.close()
+        if not user or user.email.lower() not in admin_emails:
+            return jsonify({'error': 'Forbidden'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
 def socket_login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -99,12 +328,107 @@ def socket_login_required(f):
         if socket_id not in user_sockets:
             emit('error', {'message': 'Unauthorized'})
             return
-        return f(*args, **kwargs)
+        event = request.event['message']
+        allowed, retry_after = rate_limiter.check(user_sockets[socket_id], event)
+        if not allowed:
+            # drop 策略刻意不回應；error 與超過 max_delay 的 delay 都要告知客戶端
+            if rate_limiter.policy != 'drop':
+                emit('error', {
+                    'message': 'Rate limit exceeded',
+                    'event': event,
+                    'retry_after': round(retry_after, 3)
+                })
+            return
+        try:
+            admission.enter(SOCKET_EVENT_PRIORITY.get(event, PRIORITY_NORMAL))
+        except Overloaded as e:
+            emit('error', {
+                'message': 'Server busy',
+                'event': event,
+                'retry_after': e.retry_after
+            })
+            return
+        try:
+            with handler_profiler.profile(event):
+                return f(*args, **kwargs)
+        except PoolTimeoutError:
+            emit('error', {
+                'message': 'Server busy',
+                'event': event,
+                'retry_after': admission.retry_after
+            })
+        finally:
+            admission.leave()
     return decorated_function
 
+def overloaded_response(retry_after):
+    response = jsonify({'error': 'Server busy', 'retry_after': retry_after})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(max(1, round(retry_after)))
+    return response
+
+@app.before_request
+def admit_request():
+    if request.path.startswith(('/api/', '/avatars/')) and request.endpoint != 'server_status':
+        try:
+            admission.enter(PRIORITY_NORMAL)
+        except Overloaded as e:
+            return overloaded_response(e.retry_after)
+        g.admitted = True
+
+@app.teardown_request
+def release_request(exc):
+    if g.pop('admitted', False):
+        admission.leave()
+
+@app.errorhandler(PoolTimeoutError)
+def handle_pool_timeout(e):
+    return overloaded_response(admission.retry_after)
+
+@app.route('/api/status', methods=['GET'])
+def server_status():
+    """伺服器負載狀態；未登入只回傳壓力等級，連線池與請求數僅供登入用戶"""
+    if 'user_id' not in session:
+        return jsonify({'pressure': admission.pressure()})
+    return jsonify(admission.get_status())
+
+@app.before_request
+def start_endpoint_profile():
+    if request.endpoint in handler_profiler.enabled:
+        g.endpoint_profile = handler_profiler.start(request.endpoint)
+
+@app.teardown_request
+def stop_endpoint_profile(exc):
+    profile = g.pop('endpoint_profile', None)
+    if profile is not None:
+        handler_profiler.stop(request.endpoint, profile)
+
+def shell_key():
+    template_path = os.path.join(app.template_folder, 'index.html')
+    return os.stat(template_path).st_mtime, static_assets.versions()
+
 @app.route('/')
 def index():
-    return render_template('index.html')
+    body = shell_cache.get(shell_key, lambda: render_template('index.html'))
+    response = precompressed_response(body)
+    # 外殼每次都向伺服器驗證，靜態檔才能透過新的 URL 更新
+    response.cache_control.no_cache = True
+    return response
+
+@app.endpoint('static')
+def static_file(filename):
+    """從記憶體提供靜態檔；URL 上的版本與內容相符時允許永久快取"""
+    asset = static_assets.get(filename)
+    if not asset:
+        abort(404)
+    response = precompressed_response(asset)
+    if request.args.get('v') == asset.etag:
+        response.cache_control.public = True
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
 
 @app.route('/auth/google')
 def google_login():
@@ -150,7 +474,7 @@ def google_auth_callback():
         finally:
             db.close()
     except Exception as e:
-        print(f"Google Login Error: {e}")
+        logger.exception('Google login failed')
         return f"Login failed: {str(e)}", 400
 
 @app.route('/auth/success')
@@ -196,7 +520,7 @@ def dev_login():
             'user': {
                 'id': user.id,
                 'display_name': user.display_name,
-                'avatar_url': user.avatar_url,
+                'avatar_url': avatar_url_for(user),
                 'email': user.email,
                 'last_seen': user.last_seen_at.isoformat() if user.last_seen_at else None
             },
@@ -212,6 +536,30 @@ def logout():
     user_id = session.pop('user_id', None)
     return jsonify({'message': 'Logout successful'})
 
+@app.route('/avatars/<int:user_id>')
+@login_required
+def avatar_route(user_id):
+    """提供快取的頭像縮圖"""
+    db = get_db()
+    try:
+        user = get_user_by_id(db, user_id)
+        source_url = user.avatar_url if user else None
+    finally:
+        db.close()
+
+    if not source_url:
+        return jsonify({'error': 'Avatar not found'}), 404
+
+    cached = avatar_cache.get(source_url)
+    if not cached:
+        # 抓取失敗時退回原始 URL
+        return redirect(source_url)
+
+    path, mimetype = cached
+    response = send_file(path, mimetype=mimetype, max_age=31536000, etag=True, conditional=True)
+    response.cache_control.immutable = True
+    return response
+
 @app.route('/api/me', methods=['GET'])
 @login_required
 def get_current_user():
@@ -228,7 +576,7 @@ def get_current_user():
             'user': {
                 'id': user.id,
                 'display_name': user.display_name,
-                'avatar_url': user.avatar_url,
+                'avatar_url': avatar_url_for(user),
                 'email': user.email,
                 'last_seen': user.last_seen_at.isoformat() if user.last_seen_at else None
             }
@@ -236,6 +584,108 @@ def get_current_user():
     finally:
         db.close()
 
+@app.route('/api/bootstrap', methods=['GET'])
+@login_required
+def bootstrap():
+    """聊天視窗開啟時一次取得所有初始資料（單一 DB session、固定查詢數）"""
+    timings = {}
+    started = time.perf_counter()
+
+    def mark(section):
+        nonlocal started
+        now = time.perf_counter()
+        timings[section] = round((now - started) * 1000, 3)
+        started = now
+
+    db = get_db()
+    try:
+        user_id = session['user_id']
+        user = get_user_by_id(db, user_id)
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        mark('user')
+
+        friends = get_friends(db, user_id)
+        mark('friends')
+
+        received, sent = get_friend_requests_with_users(db, user_id)
+        mark('friend_requests')
+
+        conversations = get_conversation_summaries(db, user_id)
+        mark('conversations')
+
+        recent = None
+        if conversations:
+            conv_id = conversations[0]['conversation'].id
+            recent = {
+                'conversation_id': conv_id,
+                'messages': [serialize_message(msg, serialize_sender(msg.sender), msg.attachment)
+                             for msg in list_messages(db, conv_id)]
+            }
+        mark('recent_messages')
+
+        def request_data(req, other):
+            return {
+                'id': req.id,
+                'from_user_id': req.from_user_id,
+                'to_user_id': req.to_user_id,
+                'status': req.status,
+                'created_at': req.created_at.isoformat() if req.created_at else None,
+                other: {
+                    'id': getattr(req, other).id,
+                    'display_name': getattr(req, other).display_name,
+                    'avatar_url': avatar_url_for(getattr(req, other))
+                }
+            }
+
+        result = {
+            'user': {
+                'id': user.id,
+                'display_name': user.display_name,
+                'avatar_url': avatar_url_for(user),
+                'email': user.email,
+                'last_seen': user.last_seen_at.isoformat() if user.last_seen_at else None
+            },
+            'friends': [{
+                'id': friend.id,
+                'display_name': friend.display_name,
+                'avatar_url': avatar_url_for(friend),
+                'email': friend.email,
+                'is_online': friend.id in online_users,
+                'last_seen': friend.last_seen_at.isoformat() if friend.last_seen_at else None
+            } for friend in friends],
+            'friend_requests': {
+                'received': [request_data(req, 'from_user') for req in received],
+                'sent': [request_data(req, 'to_user') for req in sent]
+            },
+            'conversations': [{
+                'id': c['conversation'].id,
+                'type': c['conversation'].type,
+                'name': c['conversation'].name,
+                'participants': [{
+                    'id': p.id,
+                    'display_name': p.display_name,
+                    'avatar_url': avatar_url_for(p),
+                    'is_online': p.id in online_users
+                } for p in c['participants']],
+                'last_message': {
+                    'id': c['last_message'].id,
+                    'content': c['last_message'].content,
+                    'sender_id': c['last_message'].sender_id,
+                    'created_at': c['last_message'].created_at.isoformat()
+                } if c['last_message'] else None,
+                'unread_count': c['unread_count']
+            } for c in conversations],
+            'recent_messages': recent
+        }
+        mark('serialize')
+
+        if app.debug:
+            result['timings_ms'] = timings
+        return jsonify(result)
+    finally:
+        db.close()
+
 @app.route('/api/users', methods=['GET'])
 @login_required
 def get_users():
@@ -251,7 +701,7 @@ def get_users():
         user_list = [{
             'id': user.id,
             'display_name': user.display_name,
-            'avatar_url': user.avatar_url,
+            'avatar_url': avatar_url_for(user),
             'email': user.email,
             'is_online': user.id in online_users,
             'last_seen': user.last_seen_at.isoformat() if user.last_seen_at else None
@@ -273,7 +723,7 @@ def get_friends_route():
         friend_list = [{
             'id': friend.id,
             'display_name': friend.display_name,
-            'avatar_url': friend.avatar_url,
+            'avatar_url': avatar_url_for(friend),
             'email': friend.email,
             'is_online': friend.id in online_users,
             'last_seen': friend.last_seen_at.isoformat() if friend.last_seen_at else None
@@ -301,7 +751,7 @@ def get_friend_requests_route():
             'from_user': {
                 'id': req.from_user.id,
                 'display_name': req.from_user.display_name,
-                'avatar_url': req.from_user.avatar_url
+                'avatar_url': avatar_url_for(req.from_user)
             }
         } for req in received]
         
@@ -314,7 +764,7 @@ def get_friend_requests_route():
             'to_user': {
                 'id': req.to_user.id,
                 'display_name': req.to_user.display_name,
-                'avatar_url': req.to_user.avatar_url
+                'avatar_url': avatar_url_for(req.to_user)
             }
         } for req in sent]
         
@@ -353,7 +803,7 @@ def send_friend_request():
         # 通知對方（如果在線）
         if to_user_id in online_users:
             from_user = get_user_by_id(db, user_id)
-            socketio.emit('friend_request:new', {
+            outbound.send(online_users[to_user_id], 'friend_request:new', {
                 'request': {
                     'id': new_request.id,
                     'from_user_id': new_request.from_user_id,
@@ -363,10 +813,10 @@ def send_friend_request():
                     'from_user': {
                         'id': from_user.id,
                         'display_name': from_user.display_name,
-                        'avatar_url': from_user.avatar_url
+                        'avatar_url': avatar_url_for(from_user)
                     }
                 }
-            }, room=online_users[to_user_id])
+            })
         
         return jsonify({
             'request': {
@@ -403,13 +853,13 @@ def respond_friend_request_route(request_id):
         # 通知對方（如果在線）
         if action == 'accepted' and updated_request.from_user_id in online_users:
             current_user = get_user_by_id(db, user_id)
-            socketio.emit('friend_request:accepted', {
+            outbound.send(online_users[updated_request.from_user_id], 'friend_request:accepted', {
                 'user': {
                     'id': current_user.id,
                     'display_name': current_user.display_name,
-                    'avatar_url': current_user.avatar_url
+                    'avatar_url': avatar_url_for(current_user)
                 }
-            }, room=online_users[updated_request.from_user_id])
+            })
         
         return jsonify({
             'request': {
@@ -441,7 +891,7 @@ def get_conversations_route():
                 'other_user': {
                     'id': other_user.id,
                     'display_name': other_user.display_name,
-                    'avatar_url': other_user.avatar_url,
+                    'avatar_url': avatar_url_for(other_user),
                     'is_online': other_user.id in online_users
                 },
                 'last_message': None,
@@ -471,39 +921,377 @@ def get_messages_route(conversation_id):
         user_id = session['user_id']
         
         # 檢查用戶是否在會話中
-        from app.models import ConversationParticipant
-        participant = db.query(ConversationParticipant).filter(
-            ConversationParticipant.conversation_id == conversation_id,
-            ConversationParticipant.user_id == user_id
-        ).first()
-        
-        if not participant:
+        if not is_participant(db, conversation_id, user_id):
             return jsonify({'error': 'Conversation not found'}), 404
         
-        messages = list_messages(db, conversation_id)
+        limit = min(request.args.get('limit', 50, type=int), 200)
+        before_id = request.args.get('before_id', type=int)
+        messages = list_messages(db, conversation_id, limit=limit, before_id=before_id)
         
-        enriched_messages = [{
-            'id': msg.id,
-            'conversation_id': msg.conversation_id,
-            'sender_id': msg.sender_id,
-            'content': msg.content,
-            'content_type': msg.content_type.value,
-            'created_at': msg.created_at.isoformat(),
-            'sender': {
-                'id': msg.sender.id,
-                'display_name': msg.sender.display_name,
-                'avatar_url': msg.sender.avatar_url
-            }
-        } for msg in messages]
+        enriched_messages = [serialize_message(msg, serialize_sender(msg.sender), msg.attachment)
+                             for msg in messages]
         
         return jsonify({'messages': enriched_messages})
     finally:
         db.close()
 
+def ndjson_export_response(make_records, filename):
+    """以 generator 串流輸出 NDJSON，?gzip=1 時輸出 gzip 壓縮檔"""
+    compress = request.args.get('gzip') == '1'
+
+    def generate():
+        db = get_db()
+        try:
+            chunks = iter_ndjson(make_records(db))
+            if compress:
+                chunks = iter_gzip(chunks)
+            yield from chunks
+        finally:
+            db.close()
+
+    filename += '.ndjson.gz' if compress else '.ndjson'
+    return Response(
+        generate(),
+        mimetype='application/gzip' if compress else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@app.route('/api/conversations/<int:conversation_id>/export', methods=['GET'])
+@login_required
+def export_conversation_route(conversation_id):
+    """串流匯出單一會話的完整歷史"""
+    db = get_db()
+    try:
+        user_id = session['user_id']
+
+        if not is_participant(db, conversation_id, user_id):
+            return jsonify({'error': 'Conversation not found'}), 404
+    finally:
+        db.close()
+
+    return ndjson_export_response(
+        lambda db: iter_conversation_messages(db, conversation_id),
+        f'conversation-{conversation_id}'
+    )
+
+@app.route('/api/export', methods=['GET'])
+@login_required
+def export_user_history_route():
+    """串流匯出當前用戶所有會話的歷史"""
+    user_id = session['user_id']
+    return ndjson_export_response(
+        lambda db: iter_user_messages(db, user_id),
+        f'user-{user_id}-history'
+    )
+
+def serialize_upload(upload):
+    return {
+        'upload_id': upload.id,
+        'filename': upload.filename,
+        'size': upload.total_size,
+        'offset': upload.received,
+        'attachment_id': upload.attachment_id
+    }
+
+@app.route('/api/uploads', methods=['POST'])
+@login_required
+def create_upload_route():
+    """建立可續傳的上傳，之後以 PATCH 分段送出檔案內容"""
+    data = request.get_json() or {}
+    filename = data.get('filename')
+    size = data.get('size')
+    if not filename or not isinstance(size, int):
+        return jsonify({'error': 'filename and size are required'}), 400
+
+    db = get_db()
+    try:
+        upload = attachment_store.create_upload(
+            db, session['user_id'], filename, data.get('mime_type'), size
+        )
+        return jsonify(serialize_upload(upload)), 201
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
+    finally:
+        db.close()
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+@login_required
+def get_upload_route(upload_id):
+    """查詢已收到的位元組數，用於中斷後續傳"""
+    db = get_db()
+    try:
+        upload = get_upload(db, upload_id, session['user_id'])
+        if not upload:
+            return jsonify({'error': 'Upload not found'}), 404
+        response = jsonify(serialize_upload(upload))
+        response.headers['Upload-Offset'] = str(upload.received)
+        return response
+    finally:
+        db.close()
+
+@app.route('/api/uploads/<upload_id>', methods=['PATCH'])
+@login_required
+def upload_chunk_route(upload_id):
+    """寫入一段檔案內容；請求本體直接串流到磁碟，Upload-Offset 必須等於已收到的大小"""
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'Upload-Offset header is required'}), 400
+
+    db = get_db()
+    try:
+        upload = get_upload(db, upload_id, session['user_id'])
+        if not upload:
+            return jsonify({'error': 'Upload not found'}), 404
+        try:
+            attachment_store.write_chunk(db, upload, offset, request.stream, request.content_length)
+        except UploadError as e:
+            response = jsonify({'error': str(e), 'offset': upload.received})
+            response.status_code = 409
+            response.headers['Upload-Offset'] = str(upload.received)
+            return response
+
+        result = serialize_upload(upload)
+        if upload.attachment_id:
+            result['attachment'] = serialize_attachment(get_attachment(db, upload.attachment_id))
+        response = jsonify(result)
+        response.headers['Upload-Offset'] = str(upload.received)
+        return response
+    finally:
+        db.close()
+
+def send_attachment_file(attachment_id, thumbnail=False):
+    db = get_db()
+    try:
+        attachment = get_attachment(db, attachment_id)
+        if not attachment or not can_access_attachment(db, attachment_id, session['user_id']):
+            return jsonify({'error': 'Attachment not found'}), 404
+        blob = attachment.blob
+        path = blob.thumbnail_path if thumbnail else blob.storage_path
+        if not path:
+            return jsonify({'error': 'Thumbnail not available'}), 404
+        # 只有內容確實是 PNG / JPEG / GIF / WebP 的圖片才內嵌顯示；其他（含 SVG、HTML）一律下載
+        inline = thumbnail or is_inline_image(attachment)
+        if thumbnail:
+            mimetype = 'image/png'
+        else:
+            mimetype = blob.image_type if inline else 'application/octet-stream'
+        filename = attachment.filename
+    finally:
+        db.close()
+
+    # conditional=True：支援 Range / If-None-Match。設定 USE_X_SENDFILE 時由反向代理以 sendfile 傳送；
+    # 否則 werkzeug 以 wsgi.file_wrapper（或分段讀檔的 Python 迭代）串流，不會整個載入記憶體
+    response = send_file(
+        path, mimetype=mimetype, download_name=filename,
+        as_attachment=not inline,
+        conditional=True, etag=True, max_age=31536000
+    )
+    # 附件內容以雜湊儲存，同一個 id 永遠是同一份內容
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    # 使用者上傳的內容：禁止瀏覽器猜測型別，即使直接開啟也不能在本站執行腳本
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.headers['Content-Security-Policy'] = 'sandbox'
+    return response
+
+@app.route('/api/attachments/<int:attachment_id>', methods=['GET'])
+@login_required
+def download_attachment_route(attachment_id):
+    """下載附件（支援 Range 續傳）"""
+    return send_attachment_file(attachment_id)
+
+@app.route('/api/attachments/<int:attachment_id>/thumbnail', methods=['GET'])
+@login_required
+def attachment_thumbnail_route(attachment_id):
+    """圖片附件的縮圖"""
+    return send_attachment_file(attachment_id, thumbnail=True)
+
+@app.route('/api/conversations/groups', methods=['POST'])
+@login_required
+def create_group_route():
+    """建立群組會話"""
+    db = get_db()
+    try:
+        user_id = session['user_id']
+        data = request.json or {}
+        name = (data.get('name') or '').strip()
+        member_ids = set(data.get('member_ids') or [])
+        member_ids.discard(user_id)
+
+        if not name:
+            return jsonify({'error': 'name is required'}), 400
+
+        # 只能邀請朋友
+        friend_ids = {friend.id for friend in get_friends(db, user_id)}
+        if not member_ids <= friend_ids:
+            return jsonify({'error': 'You can only add friends to a group'}), 400
+
+        conversation = create_group_conversation(db, user_id, name, list(member_ids))
+        participant_ids = [user_id, *sorted(member_ids)]
+        sync_room_membership(conversation.id, joined=participant_ids)
+
+        conv_data = {
+            'id': conversation.id,
+            'type': conversation.type,
+            'name': conversation.name,
+            'participant_ids': participant_ids
+        }
+        outbound.broadcast('conversation:new', conv_data, conversation_room(conversation.id))
+
+        return jsonify({'conversation': conv_data}), 201
+    finally:
+        db.close()
+
+@app.route('/api/conversations/<int:conversation_id>/participants', methods=['POST'])
+@login_required
+def add_participants_route(conversation_id):
+    """新增群組成員"""
+    db = get_db()
+    try:
+        user_id = session['user_id']
+        data = request.json or {}
+        user_ids = set(data.get('user_ids') or [])
+
+        conversation = get_conversation(db, conversation_id)
+        if not conversation or conversation.type != 'group' or not is_participant(db, conversation_id, user_id):
+            return jsonify({'error': 'Conversation not found'}), 404
+
+        friend_ids = {friend.id for friend in get_friends(db, user_id)}
+        if not user_ids <= friend_ids:
+            return jsonify({'error': 'You can only add friends to a group'}), 400
+
+        added = add_participants(db, conversation_id, list(user_ids))
+        sync_room_membership(conversation_id, joined=added)
+
+        if added:
+            outbound.broadcast('conversation:members_added', {
+                'conversation_id': conversation_id,
+                'user_ids': added,
+                'added_by': user_id
+            }, conversation_room(conversation_id))
+
+        return jsonify({'added': added})
+    finally:
+        db.close()
+
+@app.route('/api/conversations/<int:conversation_id>/participants/<int:member_id>', methods=['DELETE'])
+@login_required
+def remove_participant_route(conversation_id, member_id):
+    """離開群組（只能移除自己）"""
+    db = get_db()
+    try:
+        user_id = session['user_id']
+        if member_id != user_id:
+            return jsonify({'error': 'You can only remove yourself'}), 403
+
+        conversation = get_conversation(db, conversation_id)
+        if not conversation or conversation.type != 'group':
+            return jsonify({'error': 'Conversation not found'}), 404
+
+        if not remove_participant(db, conversation_id, member_id):
+            return jsonify({'error': 'Conversation not found'}), 404
+
+        sync_room_membership(conversation_id, left=[member_id])
+        outbound.broadcast('conversation:member_left', {
+            'conversation_id': conversation_id,
+            'user_id': member_id
+        }, conversation_room(conversation_id))
+
+        return jsonify({'message': 'Left conversation'})
+    finally:
+        db.close()
+
+@app.route('/api/stats/realtime', methods=['GET'])
+@login_required
+def realtime_stats():
+    """限流、發送佇列與快取統計"""
+    return jsonify({
+        'rate_limit': rate_limiter.get_stats(),
+        'send_queues': outbound.get_stats(),
+        'avatars': avatar_cache.get_stats(),
+        'membership': membership_cache.get_stats(),
+        'chatroom_batch': chatroom_batcher.get_stats() if chatroom_batcher else None,
+        'channels': channels.get_stats(),
+        'compression': dict(compressor.get_stats(), shell_renders=shell_cache.renders)
+    })
+
+@app.route('/api/admin/maintenance', methods=['GET'])
+@admin_required
+def maintenance_runs_route():
+    """最近的資料庫維護紀錄"""
+    db = get_db()
+    try:
+        return jsonify({'runs': recent_runs(db, limit=request.args.get('limit', 50, type=int))})
+    finally:
+        db.close()
+
+@app.route('/api/admin/maintenance/<job>', methods=['POST'])
+@admin_required
+def maintenance_run_route(job):
+    """立即執行指定的維護工作"""
+    if job not in maintenance.jobs:
+        return jsonify({'error': 'Unknown job'}), 404
+    # ?full=1 才執行完整 VACUUM（重寫整個資料庫、阻擋寫入）
+    full = job == 'vacuum' and request.args.get('full') == '1'
+    run = maintenance.run_job(job, force=True, **({'full': True} if full else {}))
+    if run is None:
+        return jsonify({'error': 'Job is running on another worker'}), 409
+    return jsonify({'run': run})
+
+@app.route('/api/admin/profile/sample', methods=['GET'])
+@admin_required
+def profile_sample_route():
+    """對所有執行緒做 N 秒取樣，回傳 collapsed stacks（可直接產生 flame graph）"""
+    seconds = min(max(request.args.get('seconds', 5, type=float), 0.1), 60)
+    interval = min(max(request.args.get('interval_ms', 5, type=float), 1), 100) / 1000
+    stacks = sample_stacks(seconds, interval)
+
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'seconds': seconds,
+            'interval_ms': interval * 1000,
+            'samples': sum(stacks.values()),
+            'stacks': dict(stacks.most_common())
+        })
+    return Response(format_collapsed(stacks), mimetype='text/plain')
+
+@app.route('/api/admin/profile/handlers', methods=['GET'])
+@admin_required
+def profile_handlers_report_route():
+    """依事件 / endpoint 名稱分組的 cProfile 結果"""
+    limit = request.args.get('limit', 30, type=int)
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in ('cumulative', 'tottime', 'calls'):
+        return jsonify({'error': 'Invalid sort'}), 400
+    return jsonify({
+        'enabled': sorted(handler_profiler.enabled),
+        'handlers': handler_profiler.report(limit=limit, sort=sort)
+    })
+
+@app.route('/api/admin/profile/handlers', methods=['POST'])
+@admin_required
+def profile_handlers_toggle_route():
+    """開啟 / 關閉特定事件或 endpoint 的 profiling"""
+    data = request.json or {}
+    names = data.get('names') or []
+    if data.get('enabled', True):
+        handler_profiler.enable(names)
+    else:
+        handler_profiler.disable(names)
+    return jsonify({'enabled': sorted(handler_profiler.enabled)})
+
+@app.route('/api/admin/profile/handlers', methods=['DELETE'])
+@admin_required
+def profile_handlers_reset_route():
+    """清除已收集的 profiling 結果"""
+    handler_profiler.reset()
+    return jsonify({'message': 'Profiles cleared'})
+
 @socketio.on('connect')
 def handle_connect():
     """客戶端連接"""
-    print(f'Client connected: {request.sid}')
+    socket_logger.info('Client connected', extra={'sid': request.sid})
     emit('connected', {'message': 'Connected to server'})
 
 @socketio.on('authenticate')
@@ -526,33 +1314,37 @@ def handle_authenticate(data):
         user_sockets[socket_id] = user_id
         online_users[user_id] = socket_id
         
+        # 加入所有會話的 room
+        for conversation_id in get_user_conversation_ids(db, user_id):
+            join_room(conversation_room(conversation_id))
+
         # 更新最後上線時間
         user.last_seen_at = datetime.now(timezone.utc)
         db.commit()
         
-        # 通知朋友用戶上線
-        friends = get_friends(db, user_id)
+        # 通知朋友用戶上線（負載高時略過）
+        friends = [] if admission.should_shed(PRIORITY_LOW) else get_friends(db, user_id)
         for friend in friends:
             if friend.id in online_users:
-                socketio.emit('user:online', {
+                outbound.send(online_users[friend.id], 'user:online', {
                     'user_id': user_id,
                     'user': {
                         'id': user.id,
                         'display_name': user.display_name,
-                        'avatar_url': user.avatar_url
+                        'avatar_url': avatar_url_for(user)
                     }
-                }, room=online_users[friend.id])
+                })
         
         emit('authenticated', {
             'user': {
                 'id': user.id,
                 'display_name': user.display_name,
-                'avatar_url': user.avatar_url,
+                'avatar_url': avatar_url_for(user),
                 'email': user.email
             }
         })
         
-        print(f'User {user_id} authenticated on socket {socket_id}')
+        socket_logger.info('User authenticated', extra={'user_id': user_id, 'sid': socket_id})
     finally:
         db.close()
 
@@ -561,9 +1353,13 @@ def handle_disconnect():
     """客戶端斷開連接"""
     socket_id = request.sid
     user_id = user_sockets.pop(socket_id, None)
+    outbound.discard(socket_id)
+    for name, count in channels.leave_all(socket_id).items():
+        outbound.broadcast('channel:subscribers', {'channel': name, 'subscribers': count}, channel_room(name))
     
     if user_id:
         online_users.pop(user_id, None)
+        membership_cache.forget_user(user_id)
         
         db = get_db()
         try:
@@ -572,16 +1368,16 @@ def handle_disconnect():
                 user.last_seen_at = datetime.now(timezone.utc)
                 db.commit()
                 
-                # 通知朋友用戶離線
-                friends = get_friends(db, user_id)
+                # 通知朋友用戶離線（負載高時略過）
+                friends = [] if admission.should_shed(PRIORITY_LOW) else get_friends(db, user_id)
                 for friend in friends:
                     if friend.id in online_users:
-                        socketio.emit('user:offline', {
+                        outbound.send(online_users[friend.id], 'user:offline', {
                             'user_id': user_id,
                             'last_seen': user.last_seen_at.isoformat()
-                        }, room=online_users[friend.id])
+                        })
             
-            print(f'User {user_id} disconnected')
+            socket_logger.info('User disconnected', extra={'user_id': user_id, 'sid': socket_id})
         finally:
             db.close()
 
@@ -593,8 +1389,9 @@ def handle_send_message(data):
     sender_id = user_sockets[socket_id]
     recipient_id = data.get('recipient_id')
     content = data.get('content', '').strip()
+    attachment_id = data.get('attachment_id')
     
-    if not content:
+    if not content and not attachment_id:
         emit('error', {'message': 'Message content cannot be empty'})
         return
     
@@ -607,38 +1404,39 @@ def handle_send_message(data):
         
         # 獲取或建立會話
         try:
-            conversation = get_or_create_direct_conversation(db, sender_id, recipient_id)
+            conversation_id = get_or_create_direct_conversation(db, sender_id, recipient_id)
         except ValueError as e:
             emit('error', {'message': str(e)})
             return
         
+        attachment = None
+        content_type = ContentType.text
+        if attachment_id:
+            attachment, content_type = resolve_attachment(db, attachment_id, sender_id)
+            if not attachment:
+                emit('error', {'message': 'Attachment not found'})
+                return
+            content = content or attachment.filename
+        
         # 儲存訊息
-        new_message = save_message(db, conversation.id, sender_id, content)
+        new_message = save_message(db, conversation_id, sender_id, content,
+                                   content_type=content_type, attachment_id=attachment_id)
         
         # 獲取發送者資訊
         sender = get_user_by_id(db, sender_id)
         
-        enriched_message = {
-            'id': new_message.id,
-            'conversation_id': new_message.conversation_id,
-            'sender_id': new_message.sender_id,
-            'content': new_message.content,
-            'created_at': new_message.created_at.isoformat(),
-            'sender': {
-                'id': sender.id,
-                'display_name': sender.display_name,
-                'avatar_url': sender.avatar_url
-            }
-        }
+        enriched_message = serialize_message(new_message, serialize_sender(sender), attachment)
         
         # 發送給自己
         emit('message:new', enriched_message)
         
         # 發送給對方（如果在線）
         if recipient_id in online_users:
-            socketio.emit('message:new', enriched_message, room=online_users[recipient_id])
+            outbound.send(online_users[recipient_id], 'message:new', enriched_message)
         
-        print(f'Message sent: {sender_id} -> {recipient_id}: {content}')
+        message_logger.info('Message sent', extra={
+            'sender_id': sender_id, 'recipient_id': recipient_id, 'content': content
+        })
     finally:
         db.close()
 
@@ -663,19 +1461,195 @@ def handle_chatroom_message(data):
             'sender': {
                 'id': sender.id,
                 'display_name': sender.display_name,
-                'avatar_url': sender.avatar_url
+                'avatar_url': avatar_url_for(sender)
             },
             'content': content,
             'created_at': datetime.now(timezone.utc).isoformat()
         }
         
         # 廣播給所有在線用戶
-        socketio.emit('chatroom:message', message_data)
+        if chatroom_batcher:
+            chatroom_batcher.add(message_data)
+        else:
+            outbound.broadcast('chatroom:message', message_data)
         
-        print(f'Chatroom message: {sender.display_name}: {content}')
+        message_logger.info('Chatroom message', extra={'sender_id': sender_id, 'content': content})
     finally:
         db.close()
 
+@socketio.on('group:send')
+@socket_login_required
+def handle_group_message(data):
+    """發送群組訊息：儲存一次，對會話 room 廣播一次"""
+    socket_id = request.sid
+    sender_id = user_sockets[socket_id]
+    conversation_id = data.get('conversation_id')
+    content = data.get('content', '').strip()
+    attachment_id = data.get('attachment_id')
+
+    if not content and not attachment_id:
+        emit('error', {'message': 'Message content cannot be empty'})
+        return
+
+    db = get_db()
+    try:
+        if not is_participant(db, conversation_id, sender_id):
+            emit('error', {'message': 'Conversation not found'})
+            return
+
+        attachment = None
+        content_type = ContentType.text
+        if attachment_id:
+            attachment, content_type = resolve_attachment(db, attachment_id, sender_id)
+            if not attachment:
+                emit('error', {'message': 'Attachment not found'})
+                return
+            content = content or attachment.filename
+
+        new_message = save_message(db, conversation_id, sender_id, content,
+                                   content_type=content_type, attachment_id=attachment_id)
+        sender = get_user_by_id(db, sender_id)
+
+        outbound.broadcast('message:new', serialize_message(new_message, serialize_sender(sender), attachment),
+                           conversation_room(conversation_id))
+    finally:
+        db.close()
+
+def socket_int(value, default=None):
+    """解析客戶端送來的整數參數，格式錯誤時回傳預設值"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+def serialize_channel_message(msg, channel_name):
+    return {
+        'id': msg.id,
+        'channel': channel_name,
+        'sender_id': msg.sender_id,
+        'content': msg.content,
+        'created_at': msg.created_at.isoformat(),
+        'sender': {
+            'id': msg.sender.id,
+            'display_name': msg.sender.display_name,
+            'avatar_url': avatar_url_for(msg.sender)
+        }
+    }
+
+@socketio.on('channel:list')
+@socket_login_required
+def handle_channel_list(data=None):
+    """列出所有頻道與訂閱人數"""
+    db = get_db()
+    try:
+        emit('channel:list', {'channels': [{
+            'name': channel.name,
+            'subscribers': channels.subscriber_count(channel.name)
+        } for channel in list_channels(db)]})
+    finally:
+        db.close()
+
+@socketio.on('channel:join')
+@socket_login_required
+def handle_channel_join(data):
+    """加入頻道（不存在時建立），回傳最近訊息"""
+    socket_id = request.sid
+    user_id = user_sockets[socket_id]
+    name = data.get('channel')
+
+    if not is_valid_channel_name(name):
+        emit('error', {'message': 'Invalid channel name'})
+        return
+
+    db = get_db()
+    try:
+        channel_id = channels.get_id(name)
+        if channel_id is None:
+            channel = get_channel_by_name(db, name)
+            if channel is None:
+                # 加入新名稱即建立頻道，每位用戶可建立的數量有上限
+                if count_channels_created_by(db, user_id) >= CHANNEL_MAX_PER_USER:
+                    emit('error', {'message': 'Channel limit reached'})
+                    return
+                channel = get_or_create_channel(db, name, created_by=user_id)
+            channel_id = channel.id
+            channels.remember_id(name, channel_id)
+
+        # 先加入 room 再讀緩衝，避免漏掉中間送出的訊息（客戶端以 id 去重）
+        join_room(channel_room(name))
+        count = channels.join(name, socket_id)
+        recent = channels.recent(name, lambda: [
+            serialize_channel_message(msg, name)
+            for msg in reversed(list_channel_messages(db, channel_id, limit=channels.recent_size))
+        ])
+    finally:
+        db.close()
+
+    emit('channel:joined', {'channel': name, 'subscribers': count, 'messages': recent})
+    outbound.broadcast('channel:subscribers', {'channel': name, 'subscribers': count}, channel_room(name))
+
+@socketio.on('channel:leave')
+@socket_login_required
+def handle_channel_leave(data):
+    """離開頻道"""
+    socket_id = request.sid
+    name = data.get('channel')
+    if not channels.is_subscribed(name, socket_id):
+        return
+
+    leave_room(channel_room(name))
+    count = channels.leave(name, socket_id)
+    emit('channel:left', {'channel': name})
+    outbound.broadcast('channel:subscribers', {'channel': name, 'subscribers': count}, channel_room(name))
+
+@socketio.on('channel:history')
+@socket_login_required
+def handle_channel_history(data):
+    """頻道較舊的訊息（以 before_id 分頁）"""
+    socket_id = request.sid
+    name = data.get('channel')
+    if not channels.is_subscribed(name, socket_id):
+        emit('error', {'message': 'Join the channel first'})
+        return
+
+    db = get_db()
+    try:
+        limit = max(1, min(socket_int(data.get('limit'), 50), 200))
+        before_id = socket_int(data.get('before_id'))
+        messages = list_channel_messages(db, channels.get_id(name), limit=limit, before_id=before_id)
+        emit('channel:history', {
+            'channel': name,
+            'messages': [serialize_channel_message(msg, name) for msg in messages]
+        })
+    finally:
+        db.close()
+
+@socketio.on('channel:send')
+@socket_login_required
+def handle_channel_message(data):
+    """發送頻道訊息：只送給該頻道的訂閱者"""
+    socket_id = request.sid
+    sender_id = user_sockets[socket_id]
+    name = data.get('channel')
+    content = data.get('content', '').strip()
+
+    if not content:
+        emit('error', {'message': 'Message content cannot be empty'})
+        return
+    if not channels.is_subscribed(name, socket_id):
+        emit('error', {'message': 'Join the channel first'})
+        return
+
+    db = get_db()
+    try:
+        new_message = save_channel_message(db, channels.get_id(name), sender_id, content)
+        message_data = serialize_channel_message(new_message, name)
+    finally:
+        db.close()
+
+    channels.append(name, message_data)
+    outbound.broadcast('channel:message', message_data, channel_room(name))
+
 @socketio.on('typing:start')
 @socket_login_required
 def handle_typing_start(data):
@@ -688,14 +1662,14 @@ def handle_typing_start(data):
         db = get_db()
         try:
             user = get_user_by_id(db, user_id)
-            socketio.emit('typing:start', {
+            outbound.send(online_users[recipient_id], 'typing:start', {
                 'user_id': user_id,
                 'user': {
                     'id': user.id,
                     'display_name': user.display_name,
-                    'avatar_url': user.avatar_url
+                    'avatar_url': avatar_url_for(user)
                 }
-            }, room=online_users[recipient_id])
+            })
         finally:
             db.close()
 
@@ -708,15 +1682,18 @@ def handle_typing_stop(data):
     recipient_id = data.get('recipient_id')
     
     if recipient_id in online_users:
-        socketio.emit('typing:stop', {'user_id': user_id}, room=online_users[recipient_id])
+        outbound.send(online_users[recipient_id], 'typing:stop', {'user_id': user_id})
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
     host = os.getenv('HOST', '127.0.0.1')
     debug = os.getenv('FLASK_DEBUG', '1') == '1'
     
-    print(f'Starting server on {host}:{port}')
-    print(f'Auth mode: {os.getenv("AUTH_MODE", "mock")}')
-    print(f'Database: {os.getenv("DATABASE_URL", "sqlite:///chatroom_dev.db")}')
+    logger.info('Starting server', extra={
+        'host': host,
+        'port': port,
+        'auth_mode': os.getenv('AUTH_MODE', 'mock'),
+        'database': os.getenv('DATABASE_URL', 'sqlite:///chatroom_dev.db')
+    })
     
     socketio.run(app, host=host, port=port, debug=debug)
\ No newline at end of file
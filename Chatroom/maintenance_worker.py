@@ -0,0 +1,67 @@
+"""資料庫維護 worker：在獨立行程中定期執行 ANALYZE、WAL checkpoint、VACUUM 與清理
+
+只在低負載時執行：以兩次輪詢間 messages / channel_messages 的新增筆數估計寫入量，
+並可設定 MAINTENANCE_STATUS_URL 參考伺服器 /api/status 回報的壓力等級。
+
+用法:
+    python maintenance_worker.py              # 依排程持續執行
+    python maintenance_worker.py --once vacuum
+    python maintenance_worker.py --once vacuum --full   # 完整 VACUUM，會阻擋寫入
+    python maintenance_worker.py --list
+"""
+import argparse
+import json
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.logging_config import configure_logging
+from app.database import SessionLocal, engine, Base
+from app.maintenance import MaintenanceScheduler, WriteActivity, default_jobs, server_pressure_ok
+
+def main():
+    parser = argparse.ArgumentParser(description='Run database maintenance jobs')
+    parser.add_argument('--once', metavar='JOB', help='run one job immediately and exit')
+    parser.add_argument('--list', action='store_true', help='list jobs and their intervals')
+    parser.add_argument('--full', action='store_true', help='with --once vacuum: full VACUUM (blocks writers)')
+    args = parser.parse_args()
+
+    configure_logging()
+    Base.metadata.create_all(bind=engine)
+    poll_interval = float(os.getenv('MAINTENANCE_POLL_SECONDS', '30'))
+    # 不在 app 行程內，無法看到 admission 狀態：改以寫入量與（選用）伺服器回報的壓力判斷
+    checks = [WriteActivity(
+        engine,
+        max_per_minute=float(os.getenv('MAINTENANCE_MAX_WRITES_PER_MINUTE', '30')),
+        window=3 * poll_interval
+    )]
+    status_url = os.getenv('MAINTENANCE_STATUS_URL')
+    if status_url:
+        checks.append(lambda: server_pressure_ok(status_url))
+    scheduler = MaintenanceScheduler(
+        engine, SessionLocal, default_jobs(),
+        is_idle=lambda: all(check() for check in checks),
+        jitter=float(os.getenv('MAINTENANCE_JITTER', '0.1')),
+        poll_interval=poll_interval
+    )
+
+    if args.list:
+        for job in scheduler.jobs.values():
+            print(f'{job.name:<25} every {job.interval / 3600:g}h')
+        return
+
+    if args.once:
+        if args.once not in scheduler.jobs:
+            parser.error(f'unknown job {args.once!r}')
+        if args.full and args.once != 'vacuum':
+            parser.error('--full only applies to vacuum')
+        run = scheduler.run_job(args.once, force=True, **({'full': True} if args.full else {}))
+        print(json.dumps(run) if run else f'{args.once} is running on another worker')
+        return
+
+    scheduler.trigger()
+    scheduler.run_forever()
+
+if __name__ == '__main__':
+    main()
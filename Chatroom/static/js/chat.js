@@ -0,0 +1,194 @@
+const socket = io();
+const messages = document.getElementById('messages');
+const messageInput = document.getElementById('message');
+let displayName = 'You';
+let isConnected = false;
+
+// Socket 连接处理
+socket.on('connect', () => {
+    console.log('Connected to server');
+    document.getElementById('server-status').textContent = 'Connected';
+    document.getElementById('server-status').style.color = 'green';
+    isConnected = true;
+
+    // [新增] 如果介面已經在聊天室模式（表示已經登入），重新連線時要自動認證
+    if (document.getElementById('chat').style.display === 'block') {
+        socket.emit('authenticate');
+    }
+});
+
+socket.on('disconnect', () => {
+    console.log('Disconnected from server');
+    document.getElementById('server-status').textContent = 'Disconnected';
+    document.getElementById('server-status').style.color = 'red';
+    isConnected = false;
+});
+
+socket.on('authenticated', (data) => {
+    console.log('User authenticated:', data);
+    addSystemMessage(`Welcome, ${data.user.display_name}!`);
+});
+
+socket.on('message:new', (data) => {
+    addMessage(data.sender.display_name, data.content, false);
+});
+
+socket.on('chatroom:message', (data) => {
+    addMessage(data.sender.display_name, data.content, false);
+});
+
+// 批次模式：一個 frame 內含多則聊天室訊息
+socket.on('chatroom:batch', (data) => {
+    data.messages.forEach((msg) => addMessage(msg.sender.display_name, msg.content, false));
+});
+
+// 連線太慢時伺服器丟掉了訊息：提示重新載入
+socket.on('sync:required', (data) => {
+    addSystemMessage(`Missed ${data.dropped} message(s) while the connection was slow. Reload to catch up.`);
+});
+
+socket.on('error', (data) => {
+    console.error('Socket error:', data);
+    addSystemMessage('Error: ' + data.message);
+});
+
+function login() {
+    displayName = document.getElementById('display_name').value || 'Anonymous';
+    if (!displayName) return;
+
+    // Hide login form and show the chat interface
+    document.getElementById('login').style.display = 'none';
+    document.getElementById('chat').style.display = 'block';
+
+    // Authenticate with server
+    if (isConnected) {
+        socket.emit('authenticate');
+    } else {
+        addSystemMessage('Please wait for server connection...');
+    }
+
+    addSystemMessage(`Logged in as ${displayName}`);
+    messageInput.focus();
+}
+
+function addMessage(sender, message, isOwn = false) {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = 'message' + (isOwn ? ' own' : '');
+
+    const senderDiv = document.createElement('div');
+    senderDiv.className = 'message-sender';
+    senderDiv.textContent = sender;
+
+    const bubbleDiv = document.createElement('div');
+    bubbleDiv.className = 'message-bubble';
+    bubbleDiv.textContent = message;
+
+    messageDiv.appendChild(senderDiv);
+    messageDiv.appendChild(bubbleDiv);
+    messages.appendChild(messageDiv);
+    messages.scrollTop = messages.scrollHeight;
+}
+
+function addSystemMessage(message) {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = 'message';
+    const bubbleDiv = document.createElement('div');
+    bubbleDiv.className = 'message-bubble';
+    bubbleDiv.style.background = '#e8e8e8';
+    bubbleDiv.style.color = '#666';
+    bubbleDiv.style.fontStyle = 'italic';
+    bubbleDiv.textContent = message;
+    messageDiv.appendChild(bubbleDiv);
+    messages.appendChild(messageDiv);
+    messages.scrollTop = messages.scrollHeight;
+}
+
+function sendMessage() {
+    const message = messageInput.value.trim();
+    if (message) {
+        addMessage(displayName, message, true);
+
+        // Send via socket or HTTP
+        if (isConnected) {
+            socket.emit('chatroom:send', { content: message });
+        } else {
+            addSystemMessage('Not connected to server');
+        }
+
+        messageInput.value = '';
+        messageInput.focus();
+    }
+}
+
+function handleKeyPress(event) {
+    if (event.key === 'Enter') {
+        sendMessage();
+    }
+}
+
+// ... (在現有的 handleKeyPress 函數之後)
+
+// [新增] 檢查登入狀態的函數
+async function checkLoginStatus() {
+    try {
+        // 一次取得用戶資訊、朋友、申請、會話與最近訊息
+        const response = await fetch('/api/bootstrap');
+        if (response.ok) {
+            const data = await response.json();
+            const user = data.user;
+
+            // 如果成功獲取用戶資訊，直接執行登入流程
+            displayName = user.display_name;
+
+            // 切換介面
+            document.getElementById('login').style.display = 'none';
+            document.getElementById('chat').style.display = 'block';
+
+            addSystemMessage(`Welcome back, ${displayName}!`);
+
+            // 如果 Socket 已連線，嘗試進行 WebSocket 認證
+            if (socket.connected) {
+                socket.emit('authenticate');
+            }
+        }
+    } catch (error) {
+        console.log('User not logged in, staying on login screen.');
+    }
+}
+
+// [新增] 當頁面載入完成時，執行檢查
+window.onload = checkLoginStatus;
+
+// [修改] Socket 連線後，如果已經透過 API 確認登入，也要觸發認證
+// 請找到原本的 socket.on('connect', ...) 並修改如下：
+/*
+原本的：
+socket.on('connect', () => {
+    console.log('Connected to server');
+    // ...
+    isConnected = true;
+});
+*/
+
+async function handleLogout() {
+    try {
+        // 呼叫 main.py 中定義的後端登出路由
+        const response = await fetch('/auth/logout', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            }
+        });
+
+        if (response.ok) {
+            // 如果成功，斷開 socket 連線並重新載入頁面以顯示登入畫面
+            if (socket) socket.disconnect();
+            window.location.reload();
+        } else {
+            console.error('Logout failed');
+            alert('登出失敗，請重試。');
+        }
+    } catch (error) {
+        console.error('Error logging out:', error);
+    }
+}